@@ -0,0 +1,353 @@
+# Copyright (C) 2024 Raphael Javaux
+# raphael@noisycamp.com
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+"""Benchmarks the extraction and RSS generation pipeline on the saved webpages of `corpus/`.
+
+`corpus/manifest.json` lists the selectors of each page. The articles of each page are repeated
+to reach every requested article count, and the pages are served by a local HTTP server. The
+median duration of each stage, and the peak memory of the pipeline, are written as JSON:
+
+    python benchmarks/extraction.py --output after.json
+
+Compares two results, e.g. before and after a change:
+
+    python benchmarks/extraction.py --compare before.json after.json
+"""
+
+import argparse
+import copy
+import http.server
+import json
+import os
+import os.path
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, os.path.join(_ROOT, "..", "src"))
+
+os.environ.setdefault("APP_SETTINGS", "web2rss.config.DevelopmentConfig")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("MISTRAL_API_KEY", "none")
+os.environ.setdefault("FEED_PRETTY_PRINT", "0")  # As in production.
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'benchmark.sqlite3')}"
+)
+
+import bs4  # noqa: E402
+
+from web2rss.app import app, db  # noqa: E402
+from web2rss.models import Feed, FeedItem, PageCache  # noqa: E402
+from web2rss.utils import feed as feed_module  # noqa: E402
+from web2rss.utils.dates import _parse_absolute_date, _parse_date  # noqa: E402
+from web2rss.utils.fetch import fetch_page  # noqa: E402
+from web2rss.utils.html import parse_html  # noqa: E402
+
+
+_CORPUS_DIR = os.path.join(_ROOT, "corpus")
+
+# Measurements compared by `--compare`.
+_METRICS = [
+    "fetch_ms", "parse_ms", "extract_ms", "extract_per_article_us", "dates_ms",
+    "dates_per_date_us", "rss_ms", "peak_memory_kb",
+]
+
+
+def run(article_counts: List[int], repeat: int) -> dict:
+    with open(os.path.join(_CORPUS_DIR, "manifest.json")) as f:
+        manifest = json.load(f)
+
+    pages = {}
+
+    for name, settings in manifest.items():
+        with open(os.path.join(_CORPUS_DIR, name)) as f:
+            html = f.read()
+
+        for count in article_counts:
+            pages[f"/{count}/{name}"] = _tile_articles(html, settings["article"], count)
+
+    server = _serve(pages)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    # Measures the pipeline, not the politeness towards the local server.
+    app.config["HTTP_HOST_RATE"] = 0
+    app.config["HTTP_HOST_CONCURRENCY"] = 1000
+
+    results = []
+
+    with app.app_context():
+        db.create_all()
+
+        for name, settings in manifest.items():
+            for count in article_counts:
+                path = f"/{count}/{name}"
+                feed = _feed(base_url + path, settings)
+
+                results.append(_run_case(feed, name, count, pages[path], repeat))
+
+    server.shutdown()
+
+    return {
+        "created_at": datetime.now(tz=timezone.utc).isoformat(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "html_parser": app.config["HTML_PARSER"],
+        "html_partial_parse": app.config["HTML_PARTIAL_PARSE"],
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare(before: dict, after: dict) -> None:
+    """Prints the ratio of each stage duration between two results."""
+
+    before_cases = {(r["page"], r["target_articles"]): r for r in before["results"]}
+
+    print(f"{before['commit'] or 'before'} -> {after['commit'] or 'after'}")
+    print("page".ljust(24) + "".join(m.rjust(24) for m in _METRICS))
+
+    for result in after["results"]:
+        key = (result["page"], result["target_articles"])
+        previous = before_cases.get(key)
+
+        if previous is None:
+            continue
+
+        ratios = []
+        for metric in _METRICS:
+            if previous[metric]:
+                ratios.append(f"{result[metric] / previous[metric]:.2f}x")
+            else:
+                ratios.append("-")
+
+        print(f"{key[0]}:{key[1]}".ljust(24) + "".join(r.rjust(24) for r in ratios))
+
+
+def _run_case(feed: Feed, page: str, target_articles: int, html: str, repeat: int) -> dict:
+    settings = (feed.date_languages, feed.date_order)
+
+    def fetch():
+        with db.session.begin():
+            db.session.query(PageCache).filter(PageCache.url == feed.url).delete()
+
+        return fetch_page(feed.url)
+
+    def parse():
+        return parse_html(html, parse_only=feed_module._article_strainer(feed))
+
+    def extract(dom):
+        _parse_absolute_date.cache_clear()
+
+        return feed_module._extract_articles(feed, dom)
+
+    def parse_dates(date_texts):
+        _parse_absolute_date.cache_clear()
+
+        return [_parse_date(text, *settings) for text in date_texts]
+
+    def render(items):
+        return feed_module.feed_to_rss(feed, items)
+
+    dom = parse()
+    articles = extract(dom)
+    date_texts = _date_texts(dom, feed)
+    items = _feed_items(feed, articles)
+
+    fetch_ms = _median_ms(fetch, repeat)
+    parse_ms = _median_ms(parse, repeat)
+    extract_ms = _median_ms(lambda: extract(dom), repeat)
+    dates_ms = _median_ms(lambda: parse_dates(date_texts), repeat)
+    rss_ms = _median_ms(lambda: render(items), repeat)
+
+    tracemalloc.start()
+    render(_feed_items(feed, extract(parse())))
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "page": page,
+        "target_articles": target_articles,
+        "articles": len(articles),
+        "html_bytes": len(html.encode("utf-8")),
+        "fetch_ms": fetch_ms,
+        "parse_ms": parse_ms,
+        "extract_ms": extract_ms,
+        "extract_per_article_us": round(extract_ms * 1000 / max(1, len(articles)), 1),
+        "dates_ms": dates_ms,
+        "dates_per_date_us": round(dates_ms * 1000 / max(1, len(date_texts)), 1),
+        "rss_ms": rss_ms,
+        "peak_memory_kb": round(peak / 1024),
+    }
+
+
+def _tile_articles(html: str, article_selector: str, count: int) -> str:
+    """Repeats the articles of the page until it has `count` of them, with distinct links."""
+
+    dom = bs4.BeautifulSoup(html, "lxml")
+
+    articles = dom.select(article_selector)
+
+    for article in articles[count:]:
+        article.decompose()
+
+    last = articles[min(count, len(articles)) - 1]
+
+    for i in range(len(articles), count):
+        article = copy.copy(articles[i % len(articles)])
+
+        for link in article.select("a[href]"):
+            separator = "&" if "?" in link["href"] else "?"
+            link["href"] = f"{link['href']}{separator}copy={i}"
+
+        last.insert_after(article)
+        last = article
+
+    return str(dom)
+
+
+def _serve(pages: Dict[str, str]) -> http.server.ThreadingHTTPServer:
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = pages.get(self.path)
+
+            if body is None:
+                self.send_error(404)
+                return
+
+            body = body.encode("utf-8")
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+def _feed(url: str, settings: Dict[str, str]) -> Feed:
+    return Feed(
+        id=1,
+        url=url,
+        page_title=url,
+        article_selector=settings["article"],
+        link_selector=settings.get("link"),
+        title_selector=settings.get("title"),
+        date_selector=settings.get("date"),
+        author_selector=settings.get("author"),
+        summary_selector=settings.get("summary"),
+        date_languages=settings.get("date_languages"),
+        date_order=settings.get("date_order"),
+    )
+
+
+def _feed_items(feed: Feed, articles: list) -> List[FeedItem]:
+    now = datetime.now(tz=timezone.utc)
+
+    return [
+        FeedItem(
+            feed_id=feed.id,
+            guid=feed_module.__article_guid(article),
+            first_seen_at=now,
+            published_at=article.date or now,
+            link=article.link,
+            title=article.title,
+            author=article.author,
+            summary=article.summary,
+        )
+        for article in articles
+    ]
+
+
+def _date_texts(dom: bs4.BeautifulSoup, feed: Feed) -> List[str]:
+    texts = []
+
+    for article_dom in dom.select(feed.article_selector):
+        date_tag = article_dom.select_one(feed.date_selector) if feed.date_selector else None
+
+        if date_tag is not None:
+            texts.append((date_tag.attrs.get("datetime") or date_tag.text).strip())
+
+    return texts
+
+
+def _median_ms(fn: Callable[[], object], repeat: int) -> float:
+    durations = []
+
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started_at)
+
+    return round(statistics.median(durations) * 1000, 3)
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=_ROOT, capture_output=True, text=True,
+        ).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--articles", type=int, nargs="+", default=[10, 100, 1000],
+        help="number of articles of the benchmarked pages.",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="runs of each stage.")
+    parser.add_argument("--output", type=str, default="-")
+    parser.add_argument("--compare", type=str, nargs=2, metavar=("BEFORE", "AFTER"))
+
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as before, open(args.compare[1]) as after:
+            compare(json.load(before), json.load(after))
+        return
+
+    results = json.dumps(run(args.articles, args.repeat), indent=2)
+
+    if args.output == "-":
+        print(results)
+    else:
+        with open(args.output, "w") as f:
+            f.write(results + "\n")
+
+
+if __name__ == "__main__":
+    main()
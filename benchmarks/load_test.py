@@ -0,0 +1,134 @@
+# Copyright (C) 2024 Raphael Javaux
+# raphael@noisycamp.com
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+"""Measures the throughput of the web app when the proxied websites are slow to respond.
+
+Serves a slow website:
+
+    python benchmarks/load_test.py origin --port 8765 --delay 1
+
+Then, after creating a feed for `http://127.0.0.1:8765/`, loads its proxy with unique URLs (so
+that the proxy cache is bypassed):
+
+    python benchmarks/load_test.py run "http://127.0.0.1:8080/feed/1/proxy/?n={i}" \\
+        --requests 1000 --concurrency 500
+
+All the requests go to the same host, so the throughput is bounded by the per-host limits of the
+proxy (`PROXY_HOST_CONCURRENCY` and `PROXY_HOST_RATE`). Lift them to measure the worker class alone.
+"""
+
+import argparse
+import http.server
+import json
+import statistics
+import time
+import urllib.error
+import urllib.request
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+
+def serve_origin(port: int, delay: float) -> None:
+    body = (
+        "<html><head><title>Slow website</title></head><body><ul>"
+        + "".join(f'<li class="post"><a href="/{i}">Article {i}</a></li>' for i in range(20))
+        + "</ul></body></html>"
+    ).encode("utf-8")
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.request_queue_size = 4096
+    server.serve_forever()
+
+
+def run_load(url: str, requests: int, concurrency: int, timeout: float) -> dict:
+    def fetch(i: int) -> Optional[float]:
+        started_at = time.monotonic()
+
+        try:
+            with urllib.request.urlopen(url.format(i=i), timeout=timeout) as resp:
+                resp.read()
+        except (urllib.error.URLError, OSError):
+            return None
+
+        return time.monotonic() - started_at
+
+    started_at = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(fetch, range(requests)))
+
+    elapsed = time.monotonic() - started_at
+
+    succeeded: List[float] = sorted(l for l in latencies if l is not None)
+
+    def percentile(p: float) -> Optional[float]:
+        if not succeeded:
+            return None
+
+        return round(succeeded[min(len(succeeded) - 1, int(p * len(succeeded)))], 3)
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "failures": requests - len(succeeded),
+        "elapsed": round(elapsed, 3),
+        "throughput": round(len(succeeded) / elapsed, 1),
+        "latency_mean": round(statistics.mean(succeeded), 3) if succeeded else None,
+        "latency_p50": percentile(0.5),
+        "latency_p99": percentile(0.99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    origin_parser = subparsers.add_parser("origin", help="Serve a slow website.")
+    origin_parser.add_argument("--port", type=int, default=8765)
+    origin_parser.add_argument("--delay", type=float, default=1.0, help="Seconds per response.")
+
+    run_parser = subparsers.add_parser("run", help="Load a URL ({i} is the request number).")
+    run_parser.add_argument("url")
+    run_parser.add_argument("--requests", type=int, default=1000)
+    run_parser.add_argument("--concurrency", type=int, default=500)
+    run_parser.add_argument("--timeout", type=float, default=120)
+
+    args = parser.parse_args()
+
+    if args.command == "origin":
+        serve_origin(args.port, args.delay)
+    elif args.command == "run":
+        print(json.dumps(run_load(args.url, args.requests, args.concurrency, args.timeout)))
+
+
+if __name__ == "__main__":
+    main()
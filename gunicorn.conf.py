@@ -1,9 +1,24 @@
+import os
+
+
 wsgi_app = "web2rss.app:app"
 
-workers = 2
-threads = 4
+# `gthread` serves each request in a thread. `gevent` serves requests in greenlets, so that a few
+# workers can wait on thousands of slow websites (e.g. in `feed_xml` and `feed_proxy`) at once.
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+
+workers = int(os.environ.get("GUNICORN_WORKERS", 2))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+
+# Maximum number of concurrent requests per `gevent` worker.
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 1000))
+
 timeout = 600
-preload_app = True
+
+# `gevent` workers patch the standard library (sockets, locks, threads) before loading the app.
+# Preloading would import the app, and its HTTP client, unpatched in the master process.
+preload_app = worker_class != "gevent"
+
 max_requests = 256
 max_requests_jitter = 32
 
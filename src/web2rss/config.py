@@ -16,7 +16,9 @@
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 
+import json
 import os
+import tempfile
 basedir = os.path.abspath(os.path.dirname(__file__))
 
 
@@ -32,6 +34,119 @@ class Config(object):
 
     MISTRAL_API_KEY = os.environ["MISTRAL_API_KEY"]
 
+    # The feed selectors are guessed locally, from the page structure. The LLM is only used when the
+    # confidence of that guess (between 0 and 1) is lower than this value.
+    SELECTOR_GUESS_MIN_CONFIDENCE = float(os.environ.get("SELECTOR_GUESS_MIN_CONFIDENCE", 0.8))
+
+    # Maximum number of tokens of the webpage content sent to the LLM to guess the feed selectors.
+    LLM_TOKEN_BUDGET = int(os.environ.get("LLM_TOKEN_BUDGET", 8000))
+
+    # Number of seconds during which a fetched webpage is served from the cache without being
+    # revalidated with the origin server.
+    FETCH_CACHE_TTL = int(os.environ.get("FETCH_CACHE_TTL", 300))
+
+    # Number of seconds after which a webpage that has not been fetched again is removed from the
+    # cache. Should be larger than the refresh interval of the feeds.
+    FETCH_CACHE_RETENTION = int(os.environ.get("FETCH_CACHE_RETENTION", 7 * 24 * 3600))
+
+    # Tree builder used by BeautifulSoup to parse webpages. "lxml" is much faster than the
+    # pure-Python "html.parser", but requires the `lxml` package.
+    HTML_PARSER = os.environ.get("HTML_PARSER", "lxml")
+
+    # Only builds the parts of the webpages that can contain articles when extracting feed items.
+    HTML_PARTIAL_PARSE = os.environ.get("HTML_PARTIAL_PARSE", "1") == "1"
+
+    # Directory of the lock files used to coordinate the gunicorn workers.
+    LOCK_DIR = os.environ.get("LOCK_DIR", os.path.join(tempfile.gettempdir(), "web2rss"))
+
+    # Directory where each process periodically writes its metrics, every `METRICS_FLUSH_INTERVAL`
+    # seconds, so that `/metrics` reports the metrics of all the gunicorn workers.
+    METRICS_DIR = os.environ.get(
+        "METRICS_DIR", os.path.join(tempfile.gettempdir(), "web2rss", "metrics")
+    )
+    METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", 5))
+
+    # Maximum size, in bytes, of the responses served by the settings page proxy.
+    PROXY_MAX_BODY_SIZE = int(os.environ.get("PROXY_MAX_BODY_SIZE", 20 * 1024 * 1024))
+
+    # On-disk cache of the responses served by the settings page proxy, bounded to
+    # `PROXY_CACHE_MAX_SIZE` bytes. Responses without caching headers are cached for
+    # `PROXY_CACHE_DEFAULT_TTL` seconds (0 to not cache them).
+    PROXY_CACHE_DIR = os.environ.get(
+        "PROXY_CACHE_DIR", os.path.join(tempfile.gettempdir(), "web2rss", "proxy-cache")
+    )
+    PROXY_CACHE_MAX_SIZE = int(os.environ.get("PROXY_CACHE_MAX_SIZE", 256 * 1024 * 1024))
+    PROXY_CACHE_DEFAULT_TTL = int(os.environ.get("PROXY_CACHE_DEFAULT_TTL", 600))
+
+    # Outbound HTTP client. `HTTP_POOL_CONNECTIONS` is the number of hosts having their connections
+    # kept alive, `HTTP_POOL_MAXSIZE` the number of connections kept alive per host. Timeouts are in
+    # seconds.
+    HTTP_POOL_CONNECTIONS = int(os.environ.get("HTTP_POOL_CONNECTIONS", 32))
+    HTTP_POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", 8))
+    HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 5))
+    HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", 30))
+    HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", 2))
+    HTTP_RETRY_BACKOFF = float(os.environ.get("HTTP_RETRY_BACKOFF", 0.5))
+    HTTP_USER_AGENT = os.environ.get(
+        "HTTP_USER_AGENT", "Mozilla/5.0 (compatible; Web2RSS; +https://github.com/RaphaelJ/web2rss)"
+    )
+
+    # Per-host limits of the outbound requests of each process: number of concurrent requests,
+    # requests per second (0 for unlimited) and burst size. Requests waiting more than
+    # `HTTP_HOST_MAX_WAIT` seconds fail. `HTTP_HOST_LIMITS` overrides them for some hosts (and their
+    # subdomains), e.g. `{"example.com": {"concurrency": 1, "rate": 0.2, "burst": 1}}`.
+    HTTP_HOST_CONCURRENCY = int(os.environ.get("HTTP_HOST_CONCURRENCY", 4))
+    HTTP_HOST_RATE = float(os.environ.get("HTTP_HOST_RATE", 2))
+    HTTP_HOST_BURST = int(os.environ.get("HTTP_HOST_BURST", 5))
+    HTTP_HOST_MAX_WAIT = float(os.environ.get("HTTP_HOST_MAX_WAIT", 10))
+    HTTP_HOST_LIMITS = json.loads(os.environ.get("HTTP_HOST_LIMITS", "{}"))
+
+    # Per-host limits of the requests proxied for the settings page. They are much larger, as a
+    # single page can load dozens of assets from its host. `HTTP_HOST_LIMITS` does not apply.
+    PROXY_HOST_CONCURRENCY = int(os.environ.get("PROXY_HOST_CONCURRENCY", 16))
+    PROXY_HOST_RATE = float(os.environ.get("PROXY_HOST_RATE", 50))
+    PROXY_HOST_BURST = int(os.environ.get("PROXY_HOST_BURST", 200))
+
+    # Number of seconds without requests to a host after it responded with a 429 or 503 status,
+    # when it did not specify a `Retry-After` delay, and maximum delay honoured.
+    HTTP_HOST_DEFAULT_COOLDOWN = float(os.environ.get("HTTP_HOST_DEFAULT_COOLDOWN", 60))
+    HTTP_HOST_MAX_COOLDOWN = float(os.environ.get("HTTP_HOST_MAX_COOLDOWN", 3600))
+
+    # Default number of seconds between two refreshes of a feed by the `refresh` command, and
+    # maximum number of feeds being refreshed concurrently.
+    FEED_REFRESH_INTERVAL = int(os.environ.get("FEED_REFRESH_INTERVAL", 900))
+    FEED_REFRESH_CONCURRENCY = int(os.environ.get("FEED_REFRESH_CONCURRENCY", 4))
+
+    # Default and maximum number of pages crawled for paginated feeds, maximum number of next pages
+    # of a feed fetched concurrently in each process, and number of pages whose extracted articles
+    # are kept in memory.
+    FEED_DEFAULT_PAGES = int(os.environ.get("FEED_DEFAULT_PAGES", 3))
+    FEED_MAX_PAGES = int(os.environ.get("FEED_MAX_PAGES", 10))
+    FEED_PAGES_CONCURRENCY = int(os.environ.get("FEED_PAGES_CONCURRENCY", 4))
+    FEED_PAGE_CACHE_SIZE = int(os.environ.get("FEED_PAGE_CACHE_SIZE", 1024))
+
+    # Maximum number of background jobs (e.g. guessing the selectors of new feeds) running
+    # concurrently in each web worker.
+    BACKGROUND_JOBS_CONCURRENCY = int(os.environ.get("BACKGROUND_JOBS_CONCURRENCY", 2))
+
+    # Number of seconds after which a new feed whose webpage is still being fetched and analyzed is
+    # considered failed, as its background job has probably been lost.
+    FEED_PENDING_TIMEOUT = int(os.environ.get("FEED_PENDING_TIMEOUT", 600))
+
+    # Feeds whose last snapshot is older than this number of seconds are refreshed on the request
+    # path instead of being served from the snapshot.
+    FEED_SNAPSHOT_MAX_AGE = int(os.environ.get("FEED_SNAPSHOT_MAX_AGE", 3600))
+
+    # Maximum number of items, the most recent ones, included in a feed document.
+    FEED_ITEMS_WINDOW = int(os.environ.get("FEED_ITEMS_WINDOW", 100))
+
+    # Number of seconds during which feed readers and intermediate caches can reuse a feed document
+    # without revalidating it.
+    FEED_MAX_AGE = int(os.environ.get("FEED_MAX_AGE", 300))
+
+    # Indents the feed documents, which makes them larger and slower to serialize.
+    FEED_PRETTY_PRINT = os.environ.get("FEED_PRETTY_PRINT", "0") == "1"
+
 
 class ProductionConfig(Config):
     DEBUG = False
@@ -45,6 +160,7 @@ class StagingConfig(Config):
 class DevelopmentConfig(Config):
     DEVELOPMENT = True
     DEBUG = True
+    FEED_PRETTY_PRINT = os.environ.get("FEED_PRETTY_PRINT", "1") == "1"
 
 
 class TestingConfig(Config):
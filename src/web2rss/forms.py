@@ -16,23 +16,19 @@
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 
-import requests
-from requests import RequestException
+from wtforms import Form, IntegerField, StringField, URLField
+from wtforms.validators import AnyOf, DataRequired, NumberRange, Optional, Regexp
 
-from wtforms import Form, StringField, URLField
-from wtforms.validators import DataRequired, Optional, ValidationError
 
+_LANGUAGES_RE = r"^[a-z]{2,3}(-[A-Za-z0-9]+)?(,[a-z]{2,3}(-[A-Za-z0-9]+)?)*$"
 
-class URLForm(Form):
-    url = URLField("Webpage URL", validators=[DataRequired()])
 
-    def validate_url(self, field):
-        try:
-            response = requests.get(field.data)
-            if not (200 <= response.status_code < 300):
-                raise ValidationError("The website returned an invalid response.")
-        except RequestException as _e:
-            raise ValidationError("An error occured when trying to reach the website.")
+class URLForm(Form):
+    # The webpage is only fetched once the feed is created, in the background.
+    url = URLField(
+        "Webpage URL",
+        validators=[DataRequired(), Regexp(r"^https?://", message="Invalid webpage URL.")],
+    )
 
 
 class SelectorForm(Form):
@@ -43,3 +39,23 @@ class SelectorForm(Form):
     date = StringField("Publication date", validators=[Optional()], filters=[lambda x: x or None])
     author = StringField("Author", validators=[Optional()], filters=[lambda x: x or None])
     summary = StringField("Summary", validators=[Optional()], filters=[lambda x: x or None])
+
+    date_languages = StringField(
+        "Date languages",
+        validators=[Optional(), Regexp(_LANGUAGES_RE)],
+        filters=[lambda x: x.replace(" ", "") if x else None],
+    )
+    date_order = StringField(
+        "Date order",
+        validators=[Optional(), AnyOf(["DMY", "DYM", "MDY", "MYD", "YDM", "YMD"])],
+        filters=[lambda x: x.upper() if x else None],
+    )
+
+    next_page = StringField(
+        "Next page links", validators=[Optional()], filters=[lambda x: x or None]
+    )
+    max_pages = IntegerField("Maximum pages", validators=[Optional(), NumberRange(min=1)])
+
+    refresh_interval = IntegerField(
+        "Refresh interval", validators=[Optional(), NumberRange(min=60)]
+    )
@@ -19,8 +19,15 @@
 import argparse
 import code
 import logging
+import sys
+
+from flask import url_for
 
 from web2rss.app import app, db
+from web2rss.models import Feed
+from web2rss.utils.db import add_missing_columns
+from web2rss.utils.opml import ImportResult, export_opml, import_opml
+from web2rss.utils.refresh import RefreshResult, refresh_all, run_refresher
 
 
 logger = logging.getLogger(__name__)
@@ -43,10 +50,41 @@ def main():
 
     create_tables = subparsers.add_parser(
         "create_tables",
-        description="creates the required database tables."
+        description="creates the required database tables, and adds the columns missing in the "
+                    "existing ones."
     )
     create_tables.set_defaults(handler=_create_tables)
 
+    refresh = subparsers.add_parser(
+        "refresh",
+        description="periodically pre-builds the feeds in the background."
+    )
+    refresh.add_argument("--concurrency", type=int, default=None)
+    refresh.add_argument(
+        "--once", action="store_true",
+        help="refreshes all the feeds once, and reports the result of each refresh."
+    )
+    refresh.set_defaults(handler=_refresh)
+
+    import_opml_parser = subparsers.add_parser(
+        "import_opml",
+        description="creates a feed for each webpage of an OPML file."
+    )
+    import_opml_parser.add_argument("path", type=str)
+    import_opml_parser.add_argument("--concurrency", type=int, default=None)
+    import_opml_parser.set_defaults(handler=_import_opml)
+
+    export_opml_parser = subparsers.add_parser(
+        "export_opml",
+        description="exports all the feeds as OPML. Feed URLs are built with SERVER_NAME."
+    )
+    export_opml_parser.add_argument("path", type=str, nargs="?", default="-")
+    export_opml_parser.add_argument(
+        "--base-url", type=str, default=None,
+        help="root URL of the web app (e.g. https://web2rss.example.com/), instead of SERVER_NAME."
+    )
+    export_opml_parser.set_defaults(handler=_export_opml)
+
     shell = subparsers.add_parser(
         "shell",
         description="opens a Python shell with the application object."
@@ -64,6 +102,80 @@ def _run(args: argparse.Namespace):
 def _create_tables(_args: argparse.Namespace):
     with app.app_context():
         db.create_all()
+        add_missing_columns()
+
+
+def _refresh(args: argparse.Namespace):
+    concurrency = args.concurrency or app.config["FEED_REFRESH_CONCURRENCY"]
+
+    if not args.once:
+        run_refresher(concurrency)
+        return
+
+    def print_result(result: RefreshResult):
+        if result.error is None:
+            print(
+                f"{result.feed_id}\t{result.elapsed:.2f}s\tOK\t{result.articles} articles\t"
+                f"{result.items} items\t{result.url}",
+                flush=True,
+            )
+        else:
+            print(
+                f"{result.feed_id}\t{result.elapsed:.2f}s\tFAILED\t{result.error}\t{result.url}",
+                flush=True,
+            )
+
+    results = refresh_all(concurrency, print_result)
+
+    failures = sum(1 for result in results if result.error is not None)
+    print(f"Refreshed {len(results) - failures} feed(s), {failures} failure(s).")
+
+    if failures:
+        sys.exit(1)
+
+
+def _import_opml(args: argparse.Namespace):
+    concurrency = args.concurrency or app.config["FEED_REFRESH_CONCURRENCY"]
+
+    with open(args.path, "rb") as f:
+        opml = f.read()
+
+    def print_result(result: ImportResult):
+        print(f"{result.feed_id or '-'}\t{result.status}\t{result.url}", flush=True)
+
+    with app.app_context():
+        results = import_opml(opml, concurrency, print_result)
+
+    # Failed feeds are created, but their webpage could not be fetched or analyzed.
+    failures = sum(1 for result in results if result.status == Feed.STATUS_FAILED)
+    skipped = sum(1 for result in results if result.feed_id is None)
+    created = len(results) - failures - skipped
+    print(
+        f"Created {created} feed(s), {failures} failure(s), skipped {skipped} existing feed(s)."
+    )
+
+    if failures:
+        sys.exit(1)
+
+
+def _export_opml(args: argparse.Namespace):
+    if args.base_url is None and not app.config["SERVER_NAME"]:
+        sys.exit("Feed URLs can't be built without SERVER_NAME. Set it or use --base-url.")
+
+    # Builds the URLs from a request to the base URL, or from `SERVER_NAME` without it.
+    if args.base_url is not None:
+        context = app.test_request_context(base_url=args.base_url)
+    else:
+        context = app.app_context()
+
+    with context:
+        opml = export_opml(lambda feed: url_for("feed_xml", id=feed.id, _external=True))
+
+    if args.path == "-":
+        sys.stdout.buffer.write(opml)
+    else:
+        with open(args.path, "wb") as f:
+            f.write(opml)
 
 
 def _shell(args: argparse.Namespace):
@@ -18,16 +18,23 @@
 
 from urllib.parse import urlparse
 
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 
 from sqlalchemy.schema import Index
 
 from web2rss.app import db
+from web2rss.utils.dates import as_utc
 
 
 class Feed(db.Model):
     __tablename__ = 'feed'
 
+    # Feeds are created as pending, until their webpage is fetched and their selectors guessed in
+    # the background. They fail if their webpage can't be fetched.
+    STATUS_PENDING = "pending"
+    STATUS_READY = "ready"
+    STATUS_FAILED = "failed"
+
     id = db.Column(db.Integer, primary_key=True)
 
     created_at = db.Column(
@@ -36,6 +43,8 @@ class Feed(db.Model):
 
     url = db.Column(db.String(), nullable=False)
 
+    status = db.Column(db.String(), nullable=False, default=STATUS_READY)
+
     page_title = db.Column(db.String(), nullable=False)
 
     article_selector = db.Column(db.String(), nullable=True)
@@ -45,9 +54,42 @@ class Feed(db.Model):
     author_selector = db.Column(db.String(), nullable=True)
     summary_selector = db.Column(db.String(), nullable=True)
 
+    # Comma separated ISO 639 codes and order of the date components (e.g. `DMY`) of the article
+    # dates. Both are detected when unset.
+    date_languages = db.Column(db.String(), nullable=True)
+    date_order = db.Column(db.String(), nullable=True)
+
+    # Selects the links to the next pages of a paginated webpage, and maximum number of pages
+    # crawled, including the first one. Defaults to `FEED_DEFAULT_PAGES`, up to `FEED_MAX_PAGES`.
+    next_page_selector = db.Column(db.String(), nullable=True)
+    max_pages = db.Column(db.Integer, nullable=True)
+
+    # Number of seconds between two background refreshes. Defaults to `FEED_REFRESH_INTERVAL`.
+    refresh_interval = db.Column(db.Integer, nullable=True)
+
+    snapshot = db.relationship("FeedSnapshot", uselist=False, cascade="all, delete-orphan")
+    items = db.relationship("FeedItem", cascade="all, delete-orphan")
+
+    def age(self) -> timedelta:
+        return _age(self.created_at)
+
     def has_required_selectors(self) -> bool:
         return self.article_selector and any([self.title_selector, self.summary_selector])
 
+    def extraction_settings(self) -> tuple:
+        """Returns the settings that affect the items extracted from the webpage."""
+
+        return (
+            self.article_selector,
+            self.link_selector,
+            self.title_selector,
+            self.date_selector,
+            self.author_selector,
+            self.summary_selector,
+            self.date_languages,
+            self.date_order,
+        )
+
     def url_path(self) -> str:
         return urlparse(self.url).path
 
@@ -55,4 +97,116 @@ class Feed(db.Model):
 Index(
     'idx_feed_created_at',
     Feed.created_at.desc(),
-)
\ No newline at end of file
+)
+
+
+class FeedItem(db.Model):
+    """An item previously extracted from the feed's webpage."""
+
+    __tablename__ = 'feed_item'
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    feed_id = db.Column(db.Integer, db.ForeignKey("feed.id"), nullable=False)
+
+    guid = db.Column(db.String(), nullable=False)
+
+    first_seen_at = db.Column(db.DateTime(), nullable=False)
+
+    # The date extracted from the webpage, or `first_seen_at` for undated items.
+    published_at = db.Column(db.DateTime(), nullable=False)
+
+    link = db.Column(db.String(), nullable=True)
+    title = db.Column(db.String(), nullable=True)
+    author = db.Column(db.String(), nullable=True)
+    summary = db.Column(db.String(), nullable=True)
+
+
+Index(
+    'idx_feed_item_feed_id_guid',
+    FeedItem.feed_id,
+    FeedItem.guid,
+    unique=True,
+)
+
+Index(
+    'idx_feed_item_feed_id_published_at',
+    FeedItem.feed_id,
+    FeedItem.published_at.desc(),
+)
+
+
+class FeedSnapshot(db.Model):
+    """Last rendered RSS document of a feed.
+
+    `cache_key` identifies the webpage content and feed settings the document has been rendered
+    from.
+    """
+
+    __tablename__ = 'feed_snapshot'
+
+    feed_id = db.Column(db.Integer, db.ForeignKey("feed.id"), primary_key=True)
+
+    created_at = db.Column(
+        db.DateTime(), nullable=False, default=lambda: datetime.now(tz=timezone.utc)
+    )
+
+    # Last time the document has been checked to be up to date with the webpage.
+    refreshed_at = db.Column(
+        db.DateTime(), nullable=False, default=lambda: datetime.now(tz=timezone.utc)
+    )
+
+    cache_key = db.Column(db.String(), nullable=False)
+
+    content = db.Column(db.LargeBinary(), nullable=False)
+
+    # HTTP validators of the document. `last_modified` is the date of the most recent item.
+    etag = db.Column(db.String(), nullable=False)
+    last_modified = db.Column(db.DateTime(), nullable=False)
+
+    # Number of articles extracted from the webpages.
+    articles = db.Column(db.Integer, nullable=True)
+
+    def age(self) -> timedelta:
+        return _age(self.refreshed_at)
+
+
+class SelectorGuessCache(db.Model):
+    """Feed selectors previously guessed by the LLM for a page layout.
+
+    `fingerprint` identifies the structural skeleton of the page.
+    """
+
+    __tablename__ = 'selector_guess_cache'
+
+    fingerprint = db.Column(db.String(), primary_key=True)
+    host = db.Column(db.String(), primary_key=True)
+
+    created_at = db.Column(
+        db.DateTime(), nullable=False, default=lambda: datetime.now(tz=timezone.utc)
+    )
+
+    # JSON object of the selectors, indexed by field name.
+    selectors = db.Column(db.Text(), nullable=False)
+
+
+class PageCache(db.Model):
+    """Last fetched content of a webpage, with the HTTP validators returned by the origin server."""
+
+    __tablename__ = 'page_cache'
+
+    url = db.Column(db.String(), primary_key=True)
+
+    fetched_at = db.Column(db.DateTime(), nullable=False)
+
+    etag = db.Column(db.String(), nullable=True)
+    last_modified = db.Column(db.String(), nullable=True)
+
+    content = db.Column(db.Text(), nullable=False)
+
+    def age(self) -> timedelta:
+        return _age(self.fetched_at)
+
+
+def _age(since: datetime) -> timedelta:
+    return datetime.now(tz=timezone.utc) - as_utc(since)
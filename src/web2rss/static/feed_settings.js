@@ -33,6 +33,15 @@ let FeedSelectorForm = {
         date: { type: String, required: false },
         author: { type: String, required: false },
         summary: { type: String, required: false },
+
+        dateLanguages: { type: String, required: false },
+        dateOrder: { type: String, required: false },
+
+        nextPage: { type: String, required: false },
+        maxPages: { type: String, required: false },
+
+        refreshInterval: { type: String, required: false },
+        defaultRefreshInterval: { type: String, required: false },
     },
     data() {
         const mainSelectorClass = "col-12"
@@ -61,8 +70,19 @@ let FeedSelectorForm = {
                     class: subSelectorClass, label: "Summary", value: this.summary,
                     parent: "article",
                 },
+                "next_page": {
+                    class: mainSelectorClass, label: "Next page links", value: this.nextPage,
+                    parent: null,
+                },
             },
 
+            dateLanguagesValue: this.dateLanguages || "",
+            dateOrderValue: this.dateOrder || "",
+
+            maxPagesValue: this.maxPages || "",
+
+            refreshIntervalValue: this.refreshInterval || "",
+
             activeSelector: null,
         }
     },
@@ -97,6 +117,80 @@ let FeedSelectorForm = {
                             @focusout="unselect(selector)">
                     </div>
 
+                    <h5 class="mt-3">Date parsing</h5>
+
+                    <div class="col-12 form-text">
+                        Optional, both are detected automatically when left empty.
+                    </div>
+
+                    <div class="col-6">
+                        <label for="date_languages" class="form-label">
+                            <small>Languages</small>
+                        </label>
+
+                        <input
+                            type="text"
+                            class="form-control form-control-sm"
+                            id="date_languages"
+                            name="date_languages"
+                            placeholder="en,fr"
+                            v-model="dateLanguagesValue">
+                    </div>
+
+                    <div class="col-6">
+                        <label for="date_order" class="form-label">
+                            <small>Order</small>
+                        </label>
+
+                        <select
+                            class="form-select form-select-sm"
+                            id="date_order"
+                            name="date_order"
+                            v-model="dateOrderValue">
+                            <option value=""></option>
+                            <option value="DMY">DMY</option>
+                            <option value="MDY">MDY</option>
+                            <option value="YMD">YMD</option>
+                        </select>
+                    </div>
+
+                    <h5 class="mt-3">Pagination</h5>
+
+                    <div class="col-12 form-text">
+                        Only used with a next page links selector.
+                    </div>
+
+                    <div class="col-6">
+                        <label for="max_pages" class="form-label">
+                            <small>Maximum pages</small>
+                        </label>
+
+                        <input
+                            type="number"
+                            class="form-control form-control-sm"
+                            id="max_pages"
+                            name="max_pages"
+                            min="1"
+                            v-model="maxPagesValue">
+                    </div>
+
+                    <h5 class="mt-3">Refresh</h5>
+
+                    <div class="col-12">
+                        <label for="refresh_interval" class="form-label">
+                            <small>Interval (seconds)</small>
+                        </label>
+
+                        <input
+                            type="number"
+                            class="form-control form-control-sm"
+                            id="refresh_interval"
+                            name="refresh_interval"
+                            min="60"
+                            :placeholder="defaultRefreshInterval"
+                            v-model="refreshIntervalValue">
+                    </div>
+
                     <div class="col-12 mt-3 d-grid">
                         <button type="submit" class="btn btn-primary">
                             <i class="bi bi-floppy"></i> Save
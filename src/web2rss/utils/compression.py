@@ -0,0 +1,105 @@
+# Copyright (C) 2024 Raphael Javaux
+# raphael@noisycamp.com
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+import gzip
+import zlib
+
+from typing import Iterable, Iterator
+
+from flask import Request, Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Responses smaller than this number of bytes are not worth compressing.
+_MIN_SIZE = 512
+
+
+def compress_response(request: Request, response: Response) -> Response:
+    """Compresses the response body with the best encoding accepted by the client.
+
+    Brotli is only offered if the `brotli` package is installed. Streamed responses are compressed
+    chunk by chunk.
+
+    The encoding is appended to the ETag of compressed responses, as each representation needs its
+    own strong validator. Conditional requests must thus be evaluated after compression.
+    """
+
+    response.vary.add("Accept-Encoding")
+
+    if response.status_code != 200 or response.direct_passthrough:
+        return response
+
+    encodings = ["br", "gzip"] if brotli is not None else ["gzip"]
+    encoding = request.accept_encodings.best_match(encodings)
+
+    if response.is_streamed:
+        if encoding is None:
+            return response
+
+        response.response = __compress_stream(response.response, encoding)
+        response.headers.pop("Content-Length", None)
+        __set_encoding(response, encoding)
+
+        return response
+
+    body = response.get_data()
+
+    if len(body) < _MIN_SIZE:
+        return response
+
+    if encoding == "br":
+        response.set_data(brotli.compress(body, quality=5))
+    elif encoding == "gzip":
+        response.set_data(gzip.compress(body, compresslevel=6))
+    else:
+        return response
+
+    __set_encoding(response, encoding)
+
+    return response
+
+
+def __set_encoding(response: Response, encoding: str) -> None:
+    response.content_encoding = encoding
+
+    etag, weak = response.get_etag()
+
+    if etag is not None:
+        response.set_etag(f"{etag}-{encoding}", weak)
+
+
+def __compress_stream(chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=5)
+        compress, flush = compressor.process, compressor.finish
+    else:
+        # `wbits=31` produces a gzip container, as `gzip.compress()` does.
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        compress, flush = compressor.compress, compressor.flush
+
+    for chunk in chunks:
+        compressed = compress(chunk)
+
+        if compressed:
+            yield compressed
+
+    yield flush()
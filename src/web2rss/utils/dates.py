@@ -0,0 +1,153 @@
+# Copyright (C) 2024 Raphael Javaux
+# raphael@noisycamp.com
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+import logging
+import re
+
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from typing import Optional, Union
+
+import dateparser
+
+from web2rss.utils.metrics import timer
+
+
+logger = logging.getLogger(__name__)
+
+
+_ISO_8601_RE = re.compile(
+    r"^\d{4}-\d{2}-\d{2}([T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?(Z|[+-]\d{2}:?\d{2})?$"
+)
+
+_RFC_2822_RE = re.compile(
+    r"^([A-Za-z]{3},\s*)?\d{1,2}\s+[A-Za-z]{3}\s+\d{4}\s+\d{1,2}:\d{2}(:\d{2})?\s+\S+$"
+)
+
+
+def parse_date(
+    text: str, languages: Optional[str] = None, date_order: Optional[str] = None
+) -> Optional[datetime]:
+    """Parses a human or machine readable date, as found in webpages.
+
+    `languages` is an optional comma separated list of ISO 639 codes, and `date_order` an optional
+    order of the date components (e.g. `DMY`). Both skip dateparser's detection heuristics.
+
+    Returns a timezone aware datetime, or `None` if the date can not be parsed.
+    """
+
+    with timer("dates"):
+        return _parse_date(text.strip(), languages or None, date_order or None)
+
+
+def is_relative_date(
+    text: str, languages: Optional[str] = None, date_order: Optional[str] = None
+) -> bool:
+    """Returns whether the date is parsed relatively to the current time (e.g. "2 hours ago")."""
+
+    return _parse_absolute_date(text.strip(), languages or None, date_order or None) is _RELATIVE
+
+
+def as_utc(date: datetime) -> datetime:
+    """Sets the UTC timezone on naive datetimes (e.g. as returned by SQLite)."""
+
+    if date.tzinfo is None:
+        return date.replace(tzinfo=timezone.utc)
+    else:
+        return date
+
+
+# Marks the dates that dateparser parses relatively to the current time (e.g. "2 hours ago").
+_RELATIVE = object()
+
+# Relative dates are detected by parsing them again from a shifted base. The shift changes every
+# component of the date, so that e.g. "March 5" (which takes the current year) is also detected.
+_RELATIVE_BASE_SHIFT = timedelta(days=400, hours=7, minutes=13)
+
+
+def _parse_date(
+    text: str, languages: Optional[str], date_order: Optional[str]
+) -> Optional[datetime]:
+    date = _parse_absolute_date(text, languages, date_order)
+
+    if date is _RELATIVE:
+        date = _parse_human_date(text, languages, date_order, datetime.now())
+
+        if date is not None:
+            date = as_utc(date)
+
+    return date
+
+
+# Only absolute dates are cached, as relative ones change over time.
+@lru_cache(maxsize=4096)
+def _parse_absolute_date(
+    text: str, languages: Optional[str], date_order: Optional[str]
+) -> Union[Optional[datetime], object]:
+    date = _parse_machine_date(text)
+
+    if date is None:
+        now = datetime.now()
+        date = _parse_human_date(text, languages, date_order, now)
+
+        if date is not None:
+            shifted_date = _parse_human_date(
+                text, languages, date_order, now - _RELATIVE_BASE_SHIFT
+            )
+
+            if shifted_date != date:
+                return _RELATIVE
+
+    if date is not None:
+        date = as_utc(date)
+
+    return date
+
+
+def _parse_machine_date(text: str) -> Optional[datetime]:
+    """Fast path for the ISO 8601 and RFC 2822 formats."""
+
+    try:
+        if _ISO_8601_RE.match(text):
+            return datetime.fromisoformat(text)
+        elif _RFC_2822_RE.match(text):
+            return parsedate_to_datetime(text)
+    except (TypeError, ValueError):
+        pass
+
+    return None
+
+
+def _parse_human_date(
+    text: str, languages: Optional[str], date_order: Optional[str], relative_base: datetime
+) -> Optional[datetime]:
+    settings = {"RELATIVE_BASE": relative_base}
+
+    if date_order:
+        settings["DATE_ORDER"] = date_order
+
+    try:
+        return dateparser.parse(
+            text,
+            languages=languages.split(",") if languages else None,
+            settings=settings,
+        )
+    except ValueError as e:  # Invalid languages or settings.
+        logger.warning(f"Unable to parse date {text!r}: {e}")
+        return None
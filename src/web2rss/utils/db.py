@@ -0,0 +1,84 @@
+# Copyright (C) 2024 Raphael Javaux
+# raphael@noisycamp.com
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+import logging
+
+from typing import List
+
+import sqlalchemy
+
+from sqlalchemy.exc import IntegrityError
+
+from web2rss.app import db
+
+
+logger = logging.getLogger(__name__)
+
+
+def upsert(entry: db.Model) -> None:
+    """Inserts or updates a row by its primary key, in its own transaction."""
+
+    try:
+        with db.session.begin():
+            db.session.merge(entry)
+    except IntegrityError:
+        # Concurrently inserted by another request. Both rows are equally fresh.
+        pass
+
+
+def add_missing_columns() -> List[str]:
+    """Adds the columns of the models that are missing in the existing tables, as `create_all()`
+    does not alter them. Returns the added columns.
+
+    Added columns must be nullable, or have a scalar default.
+    """
+
+    inspector = sqlalchemy.inspect(db.engine)
+    dialect = db.engine.dialect
+
+    added = []
+
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} "
+                ddl += column.type.compile(dialect=dialect)
+
+                if column.default is not None and column.default.is_scalar:
+                    default = sqlalchemy.literal(column.default.arg, column.type).compile(
+                        dialect=dialect, compile_kwargs={"literal_binds": True}
+                    )
+                    ddl += f" DEFAULT {default}"
+
+                if not column.nullable:
+                    ddl += " NOT NULL"
+
+                connection.execute(sqlalchemy.text(ddl))
+
+                logger.info(f"Added column {table.name}.{column.name}.")
+                added.append(f"{table.name}.{column.name}")
+
+    return added
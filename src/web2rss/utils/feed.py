@@ -17,30 +17,45 @@
 
 
 import hashlib
+import logging
 import os.path
+import threading
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime, timezone
-from functools import cache
-from typing import List, Optional
-from urllib.parse import urlparse
+from functools import cache, lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urldefrag, urljoin, urlparse
 
 import bs4
-import dateparser
 import json
-import requests
+import soupsieve
+
+from flask import has_request_context, url_for
 
-from feedgen.feed import FeedGenerator
 from mistralai.client import MistralClient
-from mistralai.exceptions import MistralAPIException
+from mistralai.exceptions import MistralException
 from mistralai.models.chat_completion import ChatMessage
-from requests.exceptions import RequestException
 
-from web2rss.app import app
-from web2rss.models import Feed
+from web2rss.app import app, db
+from web2rss.models import Feed, FeedItem, FeedSnapshot, SelectorGuessCache
+from web2rss.utils import serializers
+from web2rss.utils.dates import as_utc, is_relative_date, parse_date
+from web2rss.utils.db import upsert
+from web2rss.utils.fetch import fetch_page
+from web2rss.utils.heuristics import guess_selectors, layout_fingerprint, selectors_match
+from web2rss.utils.html import parse_html, selector_strainer
+from web2rss.utils.metrics import timer
+from web2rss.utils.minify import minify_dom
+from web2rss.utils.singleflight import SingleFlight
+
 
+logger = logging.getLogger(__name__)
 
-@dataclass
+
+@dataclass(slots=True)
 class Article:
     link: Optional[str]
     title: Optional[str]
@@ -48,96 +63,402 @@ class Article:
     author: Optional[str]
     summary: Optional[str]
 
+    # Set if the date is relative to the current time (e.g. "2 hours ago"), and changes over time.
+    relative_date: bool = False
 
-def create_feed_from_url(url: str) -> Optional[Feed]:
-    dom = _fetch_dom(url)
 
-    if dom is None:
-        return None
+def create_feed(feed_id: int) -> None:
+    """Fetches the webpage of a pending feed, and sets its page title and guessed selectors.
 
-    page_title_element = dom.select_one("html head title")
+    The feed is marked as failed if its webpage can't be fetched or analyzed, so that it never
+    stays pending.
+    """
 
-    if page_title_element is not None:
-        page_title = page_title_element.text
-    else:
-        page_title = url
+    with db.session.begin():
+        feed = db.session.get(Feed, feed_id)
+
+    if feed is None:  # Deleted in the meantime.
+        return
+
+    # Fetches and guesses outside of any transaction, as the LLM might take a while to respond.
+    try:
+        dom = _fetch_dom(feed.url)
+
+        if dom is not None:
+            page_title_element = dom.select_one("html head title")
+
+            if page_title_element is not None:
+                page_title = page_title_element.text
+            else:
+                page_title = feed.url
+
+            selectors = _guess_feed_selectors_from_dom(dom, feed.url)
+    except Exception:
+        logger.exception(f"Unable to analyze the webpage of feed {feed_id}.")
+        dom = None
+
+    with db.session.begin():
+        feed = db.session.get(Feed, feed_id, populate_existing=True)
 
-    feed = Feed(url=url, page_title=page_title)
+        if feed is None:
+            return
 
-    _guess_feed_selectors_from_dom(dom, feed)
+        if dom is None:
+            feed.status = Feed.STATUS_FAILED
+            return
 
-    return feed
+        feed.page_title = page_title
+
+        if selectors is not None:
+            _set_feed_selectors(feed, selectors)
+
+        feed.status = Feed.STATUS_READY
 
 
 def fetch_feed_items(feed: Feed) -> Optional[List[Article]]:
     """Get all the article of a given Feed object."""
 
-    dom = _fetch_dom(feed.url)
+    pages = _fetch_pages(feed)
+
+    if pages is None:
+        return None
 
-    if feed.has_required_selectors():
-        articles = dom.select(feed.article_selector)
+    return _parse_feed_items(feed, pages)
 
-        items = [
-            __parse_article_dom(feed, article_dom)
-            for article_dom in articles
-        ]
-        items = [i for i in items if i is not None]
+
+_refresh_flight = SingleFlight("refresh-feed")
+
+
+def refresh_feed(feed: Feed) -> Optional[FeedSnapshot]:
+    """Fetches the feed's webpage and persists its up-to-date RSS document.
+
+    The document is only rendered again if the webpage content or the feed settings changed since
+    the last snapshot. Returns `None` if the webpage or the feed is invalid.
+
+    Concurrent refreshes of the same feed, from any thread or worker, are coalesced into one.
+    """
+
+    requested_at = datetime.now(tz=timezone.utc)
+
+    return _refresh_flight.do(str(feed.id), lambda: __refresh_feed(feed, requested_at))
+
+
+def __refresh_feed(feed: Feed, requested_at: datetime) -> Optional[FeedSnapshot]:
+    # Reloads the snapshot, as the session may hold the one read before waiting for the lock.
+    with db.session.begin():
+        snapshot = db.session.get(FeedSnapshot, feed.id, populate_existing=True)
+
+    # Already refreshed by another worker while waiting for the lock.
+    if snapshot is not None and snapshot.age() < datetime.now(tz=timezone.utc) - requested_at:
+        return snapshot
+
+    pages = _fetch_pages(feed)
+
+    if pages is None:
+        return None
+
+    cache_key = __render_cache_key(feed, pages)
+    now = datetime.now(tz=timezone.utc)
+
+    if snapshot is not None and snapshot.cache_key == cache_key:
+        with db.session.begin():
+            snapshot.refreshed_at = now
+
+        return snapshot
+
+    articles = _parse_feed_items(feed, pages)
+
+    if articles is None:
+        return None
+
+    with timer("store"):
+        _store_feed_items(feed, articles, now)
+
+    items = feed_items(feed)
+
+    snapshot = FeedSnapshot(
+        feed_id=feed.id,
+        created_at=now,
+        refreshed_at=now,
+        cache_key=cache_key,
+        content=__render(feed, items),
+        etag=__items_etag(feed, items),
+        last_modified=__last_modified(feed, items),
+        articles=len(articles),
+    )
+
+    upsert(snapshot)
+
+    return snapshot
+
+
+def _store_feed_items(feed: Feed, articles: List[Article], seen_at: datetime) -> None:
+    """Inserts the newly seen articles, and updates the content of the previously seen ones."""
+
+    articles_by_guid = {}
+    for article in articles:
+        articles_by_guid.setdefault(__article_guid(article), article)
+
+    with db.session.begin():
+        existing_items = db.session.query(FeedItem).                            \
+            filter(FeedItem.feed_id == feed.id).                                \
+            filter(FeedItem.guid.in_(list(articles_by_guid.keys()))).           \
+            all()
+
+        existing_items = {item.guid: item for item in existing_items}
+
+        # Inserts the items in the webpage order, so that undated items sharing the same
+        # `first_seen_at` keep that order.
+        for guid, article in articles_by_guid.items():
+            item = existing_items.get(guid)
+
+            if item is None:
+                item = FeedItem(
+                    feed_id=feed.id,
+                    guid=guid,
+                    first_seen_at=seen_at,
+                    published_at=article.date or seen_at,
+                    link=article.link,
+                    title=article.title,
+                )
+                db.session.add(item)
+
+            item.author = article.author
+            item.summary = article.summary
+
+
+def _parse_feed_items(feed: Feed, pages: List[Tuple[str, str]]) -> Optional[List[Article]]:
+    """Merges the articles of the feed's pages, in order, skipping the ones already seen on a
+    previous page."""
+
+    if not feed.has_required_selectors():
+        return None
+
+    articles = {}
+
+    for url, html in pages:
+        for article in _parse_page(feed, url, html).articles:
+            articles.setdefault(__article_guid(article), article)
+
+    return list(articles.values())
+
+
+def _fetch_pages(feed: Feed) -> Optional[List[Tuple[str, str]]]:
+    """Fetches the feed's webpage and, if the feed is paginated, the next pages it links to.
+
+    The pages are crawled breadth-first, fetching the newly discovered pages concurrently. Returns
+    the URL and content of the fetched pages in crawling order, or `None` if the feed's webpage
+    can't be fetched.
+    """
+
+    html = fetch_page(feed.url)
+
+    if html is None:
+        return None
+
+    pages = [(feed.url, html)]
+    max_pages = __max_pages(feed)
+
+    host = urlparse(feed.url).netloc
+    seen_urls = {feed.url}
+    crawled = list(pages)
+
+    while crawled and len(pages) < max_pages:
+        next_urls = []
+
+        for url, html in crawled:
+            for next_url in _parse_page(feed, url, html).next_urls:
+                if len(pages) + len(next_urls) >= max_pages:
+                    break
+
+                if next_url not in seen_urls and urlparse(next_url).netloc == host:
+                    seen_urls.add(next_url)
+                    next_urls.append(next_url)
+
+        htmls = _page_executor().map(__fetch_page_in_app_context, next_urls)
+
+        crawled = [(url, html) for url, html in zip(next_urls, htmls) if html is not None]
+        pages += crawled
+
+    return pages
+
+
+# Created lazily, so that the threads are started in each gunicorn worker rather than in the
+# preloading master process.
+@cache
+def _page_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(
+        max_workers=app.config["FEED_PAGES_CONCURRENCY"], thread_name_prefix="page"
+    )
+
+
+def __fetch_page_in_app_context(url: str) -> Optional[str]:
+    with app.app_context():
+        return fetch_page(url)
+
+
+@dataclass(slots=True)
+class _Page:
+    articles: List[Article]
+    next_urls: List[str]
+
+
+class _PageCache:
+    """A thread-safe LRU cache of the pages extracted by the current process."""
+
+    def __init__(self):
+        self._pages: OrderedDict[str, _Page] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[_Page]:
+        with self._lock:
+            page = self._pages.get(key)
+
+            if page is not None:
+                self._pages.move_to_end(key)
+
+            return page
+
+    def put(self, key: str, page: _Page) -> None:
+        with self._lock:
+            self._pages[key] = page
+            self._pages.move_to_end(key)
+
+            while len(self._pages) > app.config["FEED_PAGE_CACHE_SIZE"]:
+                self._pages.popitem(last=False)
+
+
+_page_cache = _PageCache()
+
+
+def _parse_page(feed: Feed, url: str, html: str) -> _Page:
+    """Extracts the articles and the next page links of a feed's page.
+
+    The result is cached on the page content and the feed settings, so that the pages that did not
+    change since the last refresh are not parsed again.
+    """
+
+    key = __page_cache_key(feed, url, html)
+    page = _page_cache.get(key)
+
+    if page is None:
+        page = __parse_page(feed, url, html)
+        _page_cache.put(key, page)
+
+    return page
+
+
+def _article_strainer(feed: Feed) -> Optional[bs4.SoupStrainer]:
+    """Returns a strainer only keeping the articles of the webpage, if the field selectors allow
+    it."""
+
+    if not feed.article_selector:
+        return None
+
+    field_selectors = [
+        feed.link_selector,
+        feed.title_selector,
+        feed.date_selector,
+        feed.author_selector,
+        feed.summary_selector,
+    ]
+
+    return selector_strainer(
+        feed.article_selector, *(selector for selector in field_selectors if selector)
+    )
+
+
+def __parse_page(feed: Feed, url: str, html: str) -> _Page:
+    if feed.next_page_selector:
+        # The strainer can't keep both the articles and the links, as it does not support selector
+        # lists.
+        parse_only = None
     else:
-        items = None
+        parse_only = _article_strainer(feed)
+
+    with timer("parse"):
+        dom = parse_html(html, parse_only=parse_only)
+
+    with timer("extract"):
+        if feed.has_required_selectors():
+            articles = _extract_articles(feed, dom)
+        else:
+            articles = []
+
+        if feed.next_page_selector:
+            next_urls = [
+                urldefrag(urljoin(url, link.attrs["href"])).url
+                for link in dom.select(feed.next_page_selector)
+                if link.attrs.get("href")
+            ]
+        else:
+            next_urls = []
+
+    return _Page(articles, next_urls)
+
+
+def __page_cache_key(feed: Feed, url: str, html: str) -> str:
+    settings = [feed.url, url, feed.next_page_selector, *feed.extraction_settings()]
+
+    h = hashlib.sha256(html.encode("utf-8"))
+    h.update(json.dumps(settings).encode("utf-8"))
+
+    return h.hexdigest()
+
+
+def __max_pages(feed: Feed) -> int:
+    if not feed.next_page_selector:
+        return 1
 
-    return items
+    max_pages = feed.max_pages or app.config["FEED_DEFAULT_PAGES"]
 
+    return max(1, min(max_pages, app.config["FEED_MAX_PAGES"]))
 
-def feed_to_rss(feed: Feed, items: List[Article]) -> str:
-    fg = FeedGenerator()
 
-    fg.id(feed.url)
-    fg.link(href="http://127.0.0.1:5000/feed/1.xml", rel="self")
-    fg.link(href=feed.url, rel="alternate")
-    fg.title(feed.page_title)
-    fg.description(f"RSS feed generated from {feed.url}.")
+def feed_items(feed: Feed) -> List[FeedItem]:
+    """Returns the most recent items of the feed, as published in its documents."""
 
-    for item in reversed(items):
-        fe = fg.add_entry()
+    with db.session.begin():
+        return db.session.query(FeedItem).                          \
+            filter(FeedItem.feed_id == feed.id).                    \
+            order_by(FeedItem.published_at.desc(), FeedItem.id).    \
+            limit(app.config["FEED_ITEMS_WINDOW"]).                 \
+            all()
 
-        fe.guid()
 
-        guid_components = []
+# Serializer and endpoint of each feed document format.
+_FORMATS = {
+    "rss": (serializers.rss, "feed_xml"),
+    "atom": (serializers.atom, "feed_atom"),
+    "json": (serializers.json_feed, "feed_json"),
+}
 
-        if item.link:
-            fe.link(href=item.link)
-            guid_components.append(item.link)
 
-        if item.title:
-            fe.title(item.title)
-            guid_components.append(item.title)
+def serialize_feed(feed: Feed, items: List[FeedItem], format: str) -> Iterator[bytes]:
+    """Serializes the items as a `rss`, `atom` or `json` document, chunk by chunk."""
 
-        if item.date:
-            fe.pubDate(item.date)
-            guid_components.append(str(item.date))
+    serializer, endpoint = _FORMATS[format]
 
-        if item.author:
-            # FIXME: RSS requires an email value. Adds a placeholder for now.
-            fe.author({"name": item.author, "email": "unknown@domain.tld"})
+    return serializer(
+        feed,
+        items,
+        self_url=__self_url(feed, endpoint),
+        updated=__last_modified(feed, items),
+        pretty=app.config["FEED_PRETTY_PRINT"],
+    )
 
-        if item.summary:
-            fe.content(item.summary, type="CDATA")
 
-        fe.guid(__gen_guid(guid_components))
+def feed_to_rss(feed: Feed, items: List[FeedItem]) -> bytes:
+    return b"".join(serialize_feed(feed, items, "rss"))
 
-    return fg.rss_str(pretty=True)
 
 def _fetch_dom(url: str) -> Optional[bs4.BeautifulSoup]:
-    try:
-        resp = requests.get(url)
-        resp.raise_for_status()
-        resp.encoding = "utf-8"
+    html = fetch_page(url)
 
-        html = resp.text
-    except RequestException as _e:
+    if html is None:
         return None
 
-    return bs4.BeautifulSoup(html, "html.parser")
+    return parse_html(html)
 
 
 @cache
@@ -155,69 +476,200 @@ def _guess_selectors_prompt() -> str:
         return f.read()
 
 
-def _guess_feed_selectors_from_dom(dom: bs4.BeautifulSoup, feed: Feed) -> None:
-    """Uses a LLM to guess and set the item selectors from the page HTML content."""
+def _guess_feed_selectors_from_dom(
+    dom: bs4.BeautifulSoup, url: str
+) -> Optional[Dict[str, Optional[str]]]:
+    """Guesses the item selectors from the page HTML content.
+
+    Looks for repeated article-like structures first. If that guess is not confident enough, reuses
+    the LLM guess of a page sharing the same layout, or asks the LLM.
+    """
+
+    local_guess = guess_selectors(dom)
+
+    if local_guess is not None and \
+            local_guess.confidence >= app.config["SELECTOR_GUESS_MIN_CONFIDENCE"]:
+        return local_guess.selectors
+
+    fingerprint = layout_fingerprint(dom)
+    host = urlparse(url).netloc
+
+    llm_selectors = _cached_llm_guess(dom, fingerprint, host)
+
+    if llm_selectors is None:
+        llm_selectors = _guess_feed_selectors_with_llm(dom)
+
+        if llm_selectors is not None and selectors_match(dom, llm_selectors):
+            upsert(SelectorGuessCache(
+                fingerprint=fingerprint,
+                host=host,
+                created_at=datetime.now(tz=timezone.utc),
+                selectors=json.dumps(llm_selectors),
+            ))
+
+    if llm_selectors is not None:
+        return llm_selectors
+    elif local_guess is not None:
+        return local_guess.selectors
+    else:
+        return None
+
+
+def _cached_llm_guess(
+    dom: bs4.BeautifulSoup, fingerprint: str, host: str
+) -> Optional[Dict[str, Optional[str]]]:
+    """Returns the LLM guess of a page sharing the same layout, preferably from the same host, if
+    it still matches articles in the page."""
+
+    with db.session.begin():
+        cached_guesses = db.session.query(SelectorGuessCache).          \
+            filter(SelectorGuessCache.fingerprint == fingerprint).      \
+            order_by((SelectorGuessCache.host == host).desc(),          \
+                     SelectorGuessCache.created_at.desc()).             \
+            limit(8).                                                   \
+            all()
+
+    for cached_guess in cached_guesses:
+        selectors = json.loads(cached_guess.selectors)
+
+        if selectors_match(dom, selectors):
+            return selectors
+
+    return None
+
+
+def _guess_feed_selectors_with_llm(dom: bs4.BeautifulSoup) -> Optional[Dict[str, Optional[str]]]:
+    """Uses a LLM to guess the item selectors from the page HTML content."""
 
     messages = [
         ChatMessage(role="system", content=_guess_selectors_prompt()),
-        ChatMessage(role="user", content=str(dom.select_one("body"))),
+        ChatMessage(role="user", content=minify_dom(dom, app.config["LLM_TOKEN_BUDGET"])),
     ]
 
     try:
-        response = _mistral_client().chat(
-            model="mistral-large-latest",
-            response_format={"type": "json_object"},
-            messages=messages,
-        )
-    except MistralAPIException:
-        return
+        with timer("llm"):
+            response = _mistral_client().chat(
+                model="mistral-large-latest",
+                response_format={"type": "json_object"},
+                messages=messages,
+            )
+    except MistralException:  # Also covers connection errors and timeouts.
+        return None
 
     try:
         json_response = json.loads(response.choices[0].message.content)
     except json.JSONDecodeError:
-        return
+        return None
 
-    if "article" in json_response:
-        feed.article_selector = json_response["article"]
+    if isinstance(json_response, dict) and "article" in json_response:
+        return json_response
+    else:
+        return None
 
-        feed.link_selector = json_response.get("link")
-        feed.title_selector = json_response.get("title")
-        feed.date_selector = json_response.get("date")
-        feed.author_selector = json_response.get("author")
-        feed.summary_selector = json_response.get("summary")
 
+def _set_feed_selectors(feed: Feed, selectors: Dict[str, Optional[str]]) -> None:
+    feed.article_selector = selectors["article"]
 
-def __parse_article_dom(feed: Feed, article_dom: bs4.element.Tag) -> Optional[Article]:
-    link = __parse_url(feed.url, article_dom, feed.link_selector)
-    title = __parse_text(article_dom, feed.title_selector)
-    date = __parse_date(article_dom, feed.date_selector)
-    author = __parse_text(article_dom, feed.author_selector)
-    desc = __parse_text(article_dom, feed.summary_selector)
+    feed.link_selector = selectors.get("link")
+    feed.title_selector = selectors.get("title")
+    feed.date_selector = selectors.get("date")
+    feed.author_selector = selectors.get("author")
+    feed.summary_selector = selectors.get("summary")
 
-    if title or desc:  # RSS requires at least one of `title` or `desc`.
-        return Article(link, title, date, author, desc)
-    else:
-        return None
 
+def _extract_articles(feed: Feed, dom: bs4.BeautifulSoup) -> List[Article]:
+    """Extracts the articles of the parsed webpage, skipping the ones without title nor summary."""
 
-def __parse_text(article: bs4.element.Tag, selector: str) -> Optional[str]:
-    if selector is None:
-        return None
+    plan = _extraction_plan(
+        feed.article_selector,
+        feed.link_selector,
+        feed.title_selector,
+        feed.date_selector,
+        feed.author_selector,
+        feed.summary_selector,
+    )
 
-    text_tag = article.select_one(selector)
+    articles = []
 
-    if text_tag is not None:
-        return text_tag.text
+    for article_dom in plan.article.select(dom):
+        article = __parse_article_dom(feed, plan, article_dom)
+
+        if article is not None:
+            articles.append(article)
+
+    return articles
+
+
+class _ExtractionPlan:
+    """The compiled selectors of a feed."""
+
+    __slots__ = ("article", "fields")
+
+    def __init__(self, article_selector: str, field_selectors: Dict[str, Optional[str]]):
+        self.article = soupsieve.compile(article_selector)
+
+        self.fields = [
+            (name, soupsieve.compile(selector))
+            for name, selector in field_selectors.items()
+            if selector is not None
+        ]
+
+    def field_tags(self, article_dom: bs4.element.Tag) -> Dict[str, bs4.element.Tag]:
+        """Returns the first element matching each field selector within the article."""
+
+        # Testing every element of the article against all the selectors in a single traversal is
+        # slower, as soupsieve sets up a new matcher for every tested element.
+        tags = {}
+
+        for name, selector in self.fields:
+            tag = selector.select_one(article_dom)
+
+            if tag is not None:
+                tags[name] = tag
+
+        return tags
+
+
+# Keyed on the selectors, so that feeds get a new plan once their selectors change.
+@lru_cache(maxsize=256)
+def _extraction_plan(
+    article: str,
+    link: Optional[str],
+    title: Optional[str],
+    date: Optional[str],
+    author: Optional[str],
+    summary: Optional[str],
+) -> _ExtractionPlan:
+    return _ExtractionPlan(article, {
+        "link": link, "title": title, "date": date, "author": author, "summary": summary,
+    })
+
+
+def __parse_article_dom(
+    feed: Feed, plan: _ExtractionPlan, article_dom: bs4.element.Tag
+) -> Optional[Article]:
+    tags = plan.field_tags(article_dom)
+
+    link = __parse_url(feed.url, tags.get("link"))
+    title = __parse_text(tags.get("title"))
+    date, relative_date = __parse_date(feed, tags.get("date"))
+    author = __parse_text(tags.get("author"))
+    desc = __parse_text(tags.get("summary"))
+
+    if title or desc:  # RSS requires at least one of `title` or `desc`.
+        return Article(link, title, date, author, desc, relative_date)
     else:
         return None
 
 
-def __parse_url(feed_url: str, article: bs4.element.Tag, selector: str) -> Optional[str]:
-    if selector is None:
+def __parse_text(text_tag: Optional[bs4.element.Tag]) -> Optional[str]:
+    if text_tag is not None:
+        return text_tag.text
+    else:
         return None
 
-    url_tag = article.select_one(selector)
 
+def __parse_url(feed_url: str, url_tag: Optional[bs4.element.Tag]) -> Optional[str]:
     if url_tag is None:
         return None
     elif "href" in url_tag.attrs:
@@ -228,19 +680,102 @@ def __parse_url(feed_url: str, article: bs4.element.Tag, selector: str) -> Optio
         return None
 
 
-def __parse_date(article: bs4.element.Tag, selector: str) -> Optional[datetime]:
-    date_text = __parse_text(article, selector)
+def __parse_date(
+    feed: Feed, date_tag: Optional[bs4.element.Tag]
+) -> Tuple[Optional[datetime], bool]:
+    """Returns the date of the article, and whether it is relative to the current time."""
 
-    if date_text is not None:
-        date = dateparser.parse(date_text)
+    if date_tag is None:
+        return None, False
 
-        if date.tzinfo is None:
-            date = date.replace(tzinfo=timezone.utc)
+    # <time> elements usually provide a machine readable date.
+    texts = [date_tag.attrs.get("datetime"), date_tag.text]
 
-        return date
-    else:
+    for text in texts:
+        if not text:
+            continue
+
+        date = parse_date(text, feed.date_languages, feed.date_order)
+
+        if date is not None:
+            return date, is_relative_date(text, feed.date_languages, feed.date_order)
+
+    return None, False
+
+
+def __render(feed: Feed, items: List[FeedItem]) -> bytes:
+    with timer("render"):
+        return feed_to_rss(feed, items)
+
+
+def __render_cache_key(feed: Feed, pages: List[Tuple[str, str]]) -> str:
+    """Identifies the content of the webpages and the feed settings a RSS document is rendered
+    from."""
+
+    settings = [
+        feed.url, feed.page_title, feed.next_page_selector, feed.max_pages,
+        *feed.extraction_settings(),
+    ]
+
+    h = hashlib.sha256()
+
+    for url, html in pages:
+        h.update(json.dumps(url).encode("utf-8"))
+        h.update(hashlib.sha256(html.encode("utf-8")).digest())
+
+    h.update(json.dumps(settings).encode("utf-8"))
+
+    return h.hexdigest()
+
+
+def __self_url(feed: Feed, endpoint: str) -> Optional[str]:
+    # Absolute URLs can't be built outside of a request without `SERVER_NAME` (e.g. when the
+    # refresher runs in development).
+    if not has_request_context() and not app.config["SERVER_NAME"]:
         return None
 
+    return url_for(endpoint, id=feed.id, _external=True)
+
+
+def __items_etag(feed: Feed, items: List[FeedItem]) -> str:
+    """Generates a strong ETag for the RSS document of the given items.
+
+    The ETag is derived from the item GUIDs and the fields not covered by them, so that it remains
+    the same when the webpage changes without affecting the items.
+    """
+
+    components = [feed.url, feed.page_title]
+
+    for item in items:
+        components += [item.guid, item.author or "", item.summary or ""]
+
+    return __gen_guid(components)
+
+
+def __last_modified(feed: Feed, items: List[FeedItem]) -> datetime:
+    """Returns the date of the most recent item, or the feed creation date if there is none."""
+
+    if items:
+        return max(as_utc(item.published_at) for item in items)
+    else:
+        return as_utc(feed.created_at)
+
+
+def __article_guid(article: Article) -> str:
+    guid_components = []
+
+    if article.link:
+        guid_components.append(article.link)
+
+    if article.title:
+        guid_components.append(article.title)
+
+    # Relative dates would give the article a new GUID at every refresh.
+    if article.date and not article.relative_date:
+        guid_components.append(str(article.date))
+
+    return __gen_guid(guid_components)
+
 
 def __gen_guid(components: List[str]) -> str:
     """Generates an unique and deterministic ID from an item content."""
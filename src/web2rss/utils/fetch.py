@@ -0,0 +1,130 @@
+# Copyright (C) 2024 Raphael Javaux
+# raphael@noisycamp.com
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+import time
+
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from requests.exceptions import RequestException
+
+from web2rss.app import app, db
+from web2rss.models import PageCache
+from web2rss.utils.db import upsert
+from web2rss.utils.http import http_get
+from web2rss.utils.metrics import inc
+from web2rss.utils.throttle import THROTTLING_STATUSES, Throttled
+
+
+def fetch_page(url: str) -> Optional[str]:
+    """Fetches the HTML content of a webpage, going through the persistent fetch cache.
+
+    Cached pages younger than `FETCH_CACHE_TTL` are returned without contacting the origin server.
+    Older ones are revalidated with a conditional GET, and reused as-is on a `304 Not Modified`.
+    They are also reused, even if stale, while the website is throttling our requests.
+    """
+
+    with db.session.begin():
+        cached = db.session.get(PageCache, url)
+
+    if cached is not None and cached.age() < timedelta(seconds=app.config["FETCH_CACHE_TTL"]):
+        inc("web2rss_fetch_cache_total", result="hit")
+        return cached.content
+
+    headers = {}
+
+    if cached is not None:
+        if cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+
+    try:
+        resp = http_get(url, headers=headers)
+
+        if cached is not None and resp.status_code == 304:
+            with db.session.begin():
+                cached.fetched_at = datetime.now(tz=timezone.utc)
+
+            inc("web2rss_fetch_cache_total", result="revalidated")
+            return cached.content
+
+        if cached is not None and resp.status_code in THROTTLING_STATUSES:
+            inc("web2rss_fetch_cache_total", result="stale")
+            return cached.content
+
+        resp.raise_for_status()
+        resp.encoding = "utf-8"
+
+        html = resp.text
+    except Throttled as _e:
+        if cached is None:
+            return None
+
+        inc("web2rss_fetch_cache_total", result="stale")
+        return cached.content
+    except RequestException as _e:
+        return None
+
+    inc("web2rss_fetch_cache_total", result="miss")
+    inc("web2rss_upstream_bytes_total", len(resp.content), source="fetch")
+
+    upsert(PageCache(
+        url=url,
+        fetched_at=datetime.now(tz=timezone.utc),
+        etag=resp.headers.get("etag"),
+        last_modified=resp.headers.get("last-modified"),
+        content=html,
+    ))
+
+    _maybe_prune()
+
+    return html
+
+
+def forget_page(url: str) -> None:
+    """Removes the cached content of a webpage."""
+
+    with db.session.begin():
+        db.session.query(PageCache).filter(PageCache.url == url).delete()
+
+
+# Minimum number of seconds between two prunings of the fetch cache by a process.
+_PRUNING_INTERVAL = 3600
+
+_last_pruning = 0.0
+
+
+def _maybe_prune() -> None:
+    """Removes the pages that have not been fetched nor revalidated for `FETCH_CACHE_RETENTION`
+    seconds (e.g. the pages of deleted feeds), at most every `_PRUNING_INTERVAL` seconds."""
+
+    global _last_pruning
+
+    now = time.monotonic()
+
+    if now - _last_pruning < _PRUNING_INTERVAL:
+        return
+
+    _last_pruning = now
+
+    cutoff = datetime.now(tz=timezone.utc) - timedelta(seconds=app.config["FETCH_CACHE_RETENTION"])
+
+    with db.session.begin():
+        db.session.query(PageCache).filter(PageCache.fetched_at < cutoff).delete()
+
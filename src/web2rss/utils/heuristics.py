@@ -0,0 +1,289 @@
+# Copyright (C) 2024 Raphael Javaux
+# raphael@noisycamp.com
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+import hashlib
+import math
+import re
+
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import bs4
+import soupsieve
+
+
+@dataclass
+class SelectorGuess:
+    # Selectors indexed by field name (`article`, `link`, `title` ...), as returned by the LLM.
+    selectors: Dict[str, Optional[str]]
+
+    # Between 0 and 1.
+    confidence: float
+
+
+_HEADING_TAGS = ["h1", "h2", "h3", "h4", "h5", "h6"]
+
+# Minimum number of similar siblings to be considered as a list of articles.
+_MIN_ARTICLES = 3
+
+_DATE_CLASS_RE = re.compile(r"date|time|publish|posted", re.IGNORECASE)
+_AUTHOR_CLASS_RE = re.compile(r"author|byline|writer", re.IGNORECASE)
+_SUMMARY_CLASS_RE = re.compile(r"summary|excerpt|desc|teaser|intro|lead|abstract", re.IGNORECASE)
+
+# Elements taken into account by the layout fingerprint, in addition to the elements having classes.
+_STRUCTURAL_TAGS = {
+    "article", "aside", "body", "div", "footer", "header", "li", "main", "nav", "ol", "section",
+    "table", "tr", "ul",
+}
+
+_IDENTIFIER_RE = re.compile(r"^-?[A-Za-z_][\w-]*$")
+
+
+def guess_selectors(dom: bs4.BeautifulSoup) -> Optional[SelectorGuess]:
+    """Guesses the feed selectors by looking for the largest group of similar sibling elements
+    (same tag and classes) containing a link and a heading.
+
+    Returns `None` if the page has no such group.
+    """
+
+    best = None
+    best_score = 0.0
+
+    for parent in dom.find_all(True):
+        groups = defaultdict(list)
+
+        for child in parent.find_all(True, recursive=False):
+            groups[_signature(child)].append(child)
+
+        for articles in groups.values():
+            if len(articles) < _MIN_ARTICLES:
+                continue
+
+            with_link = sum(1 for a in articles if a.find("a", href=True) is not None)
+            with_heading = sum(1 for a in articles if a.find(_HEADING_TAGS) is not None)
+
+            if not with_link:
+                continue
+
+            text_length = sum(len(a.get_text(strip=True)) for a in articles) / len(articles)
+
+            score = (with_heading + 0.5 * with_link) * math.log1p(text_length)
+
+            if score > best_score:
+                best = (parent, articles)
+                best_score = score
+
+    if best is None:
+        return None
+
+    parent, articles = best
+
+    article_selector = _article_selector(dom, parent, articles)
+
+    if article_selector is None:
+        return None
+
+    title = _field_selector(articles, lambda a: a.find(_HEADING_TAGS))
+
+    link = _field_selector(
+        articles,
+        lambda a: (title and a.select_one(f"{title} a[href]")) or a.find("a", href=True),
+    )
+
+    if title is None:  # Falls back to the link text.
+        title = link
+
+    date = _field_selector(
+        articles, lambda a: a.find("time") or a.find(class_=_DATE_CLASS_RE)
+    )
+    author = _field_selector(articles, lambda a: a.find(class_=_AUTHOR_CLASS_RE))
+    summary = _field_selector(
+        articles, lambda a: a.find(class_=_SUMMARY_CLASS_RE) or _longest_paragraph(a)
+    )
+
+    selectors = {
+        "article": article_selector,
+        "link": link,
+        "title": title,
+        "date": date,
+        "author": author,
+        "summary": summary,
+    }
+
+    return SelectorGuess(selectors, _confidence(articles, selectors))
+
+
+def selectors_match(dom: bs4.BeautifulSoup, selectors: Dict[str, Optional[str]]) -> bool:
+    """Checks that the selectors find several articles in the page, most of them having a title or
+    a summary."""
+
+    try:
+        articles = dom.select(selectors["article"])
+    except (KeyError, TypeError, soupsieve.SelectorSyntaxError):
+        return False
+
+    if len(articles) < _MIN_ARTICLES:
+        return False
+
+    def has_content(article: bs4.element.Tag) -> bool:
+        for field in ["title", "summary"]:
+            selector = selectors.get(field)
+
+            try:
+                if selector and article.select_one(selector) is not None:
+                    return True
+            except soupsieve.SelectorSyntaxError:
+                return False
+
+        return False
+
+    return sum(1 for a in articles if has_content(a)) * 2 >= len(articles)
+
+
+def layout_fingerprint(dom: bs4.BeautifulSoup) -> str:
+    """Hashes the structural skeleton of the page, i.e. which elements (by tag and classes) are
+    nested in which.
+
+    The fingerprint ignores the content, and the number of repeated elements, so that pages sharing
+    a template (e.g. the categories of a news website) usually share the same fingerprint.
+    """
+
+    edges = set()
+
+    root = dom.select_one("body") or dom
+
+    for element in root.find_all(True):
+        if not _is_structural(element):
+            continue
+
+        parent = element.parent
+        while parent is not None and parent is not root and not _is_structural(parent):
+            parent = parent.parent
+
+        parent_signature = _compound(parent) if parent is not None else ""
+        edges.add(f"{parent_signature}>{_compound(element)}")
+
+    return hashlib.sha256("\n".join(sorted(edges)).encode("utf-8")).hexdigest()
+
+
+def _is_structural(element: bs4.element.Tag) -> bool:
+    return element.name in _STRUCTURAL_TAGS or bool(_classes(element))
+
+
+def _confidence(articles: List[bs4.element.Tag], selectors: Dict[str, Optional[str]]) -> float:
+    """The share of articles having both a title and a link, lowered for short lists and for titles
+    not taken from headings."""
+
+    def coverage(selector: Optional[str]) -> float:
+        if selector is None:
+            return 0.0
+
+        return sum(1 for a in articles if a.select_one(selector) is not None) / len(articles)
+
+    confidence = coverage(selectors["title"]) * coverage(selectors["link"])
+
+    if selectors["title"] == selectors["link"]:
+        confidence *= 0.5
+
+    return confidence * min(1.0, len(articles) / 5)
+
+
+def _field_selector(
+    articles: List[bs4.element.Tag],
+    find: Callable[[bs4.element.Tag], Optional[bs4.element.Tag]],
+) -> Optional[str]:
+    """Returns the most common selector of the element found by `find` in each article, if found
+    in at least half of them."""
+
+    counts = defaultdict(int)
+
+    for article in articles:
+        element = find(article)
+
+        if element is not None:
+            counts[_relative_path(article, element)] += 1
+
+    if not counts:
+        return None
+
+    selector, count = max(counts.items(), key=lambda item: item[1])
+
+    if count * 2 < len(articles):
+        return None
+
+    return selector
+
+
+def _longest_paragraph(article: bs4.element.Tag) -> Optional[bs4.element.Tag]:
+    paragraphs = [p for p in article.find_all("p") if len(p.get_text(strip=True)) >= 40]
+    return max(paragraphs, key=lambda p: len(p.get_text(strip=True)), default=None)
+
+
+def _signature(element: bs4.element.Tag) -> Tuple[str, Tuple[str, ...]]:
+    return element.name, tuple(sorted(_classes(element)))
+
+
+def _classes(element: bs4.element.Tag) -> List[str]:
+    return [c for c in element.get("class") or [] if _IDENTIFIER_RE.match(c)]
+
+
+def _compound(element: bs4.element.Tag) -> str:
+    return element.name + "".join(f".{soupsieve.escape(c)}" for c in _classes(element))
+
+
+def _article_selector(
+    dom: bs4.BeautifulSoup, parent: bs4.element.Tag, articles: List[bs4.element.Tag]
+) -> Optional[str]:
+    """Returns the shortest selector matching exactly the given articles, made of the compounds of
+    their ancestors up to the closest ancestor having an ID."""
+
+    path = []
+    element = parent
+
+    while isinstance(element, bs4.element.Tag) and element.name != "[document]":
+        element_id = element.get("id")
+
+        if element_id and _IDENTIFIER_RE.match(element_id):
+            path.insert(0, f"{element.name}#{soupsieve.escape(element_id)}")
+        else:
+            path.insert(0, _compound(element))
+
+        selector = " > ".join(path + [_compound(articles[0])])
+
+        if len(dom.select(selector)) == len(articles):
+            return selector
+
+        if element_id or element.name in ("body", "html"):
+            break
+
+        element = element.parent
+
+    return None
+
+
+def _relative_path(ancestor: bs4.element.Tag, element: bs4.element.Tag) -> str:
+    """Returns the selector of `element` relative to `ancestor`."""
+
+    path = []
+
+    while element is not ancestor:
+        path.append(_compound(element))
+        element = element.parent
+
+    return " ".join(reversed(path))
@@ -0,0 +1,132 @@
+# Copyright (C) 2024 Raphael Javaux
+# raphael@noisycamp.com
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+import logging
+import re
+
+from functools import cache
+from typing import Optional, Set
+
+import bs4
+
+from web2rss.app import app
+
+
+logger = logging.getLogger(__name__)
+
+
+# Matches selectors starting with a simple compound (e.g. `div.list#main`), optionally followed by
+# descendant or child combinators.
+_STRAINABLE_SELECTOR_RE = re.compile(
+    r"^\s*(?P<tag>[a-zA-Z][\w-]*)?(?P<qualifiers>(?:[.#][a-zA-Z_-][\w-]*)*)(?:\s*>\s*|\s+|\s*$)"
+)
+
+
+def parse_html(html: str, parse_only: Optional[bs4.SoupStrainer] = None) -> bs4.BeautifulSoup:
+    """Parses an HTML document with the tree builder configured by `HTML_PARSER`.
+
+    If `parse_only` is provided, only the matching elements and their subtrees are built.
+    """
+
+    return bs4.BeautifulSoup(html, _tree_builder(), parse_only=parse_only)
+
+
+@cache
+def selector_strainer(selector: str, *inner_selectors: str) -> Optional[bs4.SoupStrainer]:
+    """Returns a strainer only keeping the subtrees that can contain elements matching `selector`.
+
+    The strainer matches the selector's first compound (e.g. `main.list` in `main.list article`), so
+    that every element matched by the selector is kept along with its subtree, while the rest of
+    the page (scripts, styles, navigation ...) is skipped by the parser.
+
+    `inner_selectors` are the selectors later matched within these elements (e.g. the article
+    fields). As the ancestors of the kept subtrees are not parsed, they must not depend on them.
+
+    Returns `None` if no such strainer can be safely derived, e.g. for selectors starting with a
+    pseudo-class, using sibling combinators or selector lists, or if an inner selector might match
+    ancestors of the elements.
+    """
+
+    if not app.config["HTML_PARTIAL_PARSE"] or any(c in selector for c in ",+~"):
+        return None
+
+    outer_qualifiers = set(re.findall(r"[.#][\w-]+", selector))
+
+    if not all(__is_contained(inner, outer_qualifiers) for inner in inner_selectors):
+        return None
+
+    match = _STRAINABLE_SELECTOR_RE.match(selector)
+
+    if match is None:
+        return None
+
+    tag = match.group("tag")
+    qualifiers = re.findall(r"([.#])([\w-]+)", match.group("qualifiers"))
+
+    if not tag and not qualifiers:
+        return None
+
+    kwargs = {}
+
+    if tag:
+        kwargs["name"] = tag.lower()
+
+    for kind, value in qualifiers:
+        if kind == "#":
+            kwargs["id"] = value
+        elif "class_" not in kwargs:
+            # Only strains on the first class. Keeping more elements than required is harmless.
+            kwargs["class_"] = re.compile(rf"(^|\s){re.escape(value)}(\s|$)")
+
+    return bs4.SoupStrainer(**kwargs)
+
+
+def __is_contained(selector: str, outer_qualifiers: Set[str]) -> bool:
+    """Returns whether `selector` only depends on the elements it is matched within.
+
+    Single compounds (e.g. `h2.title`) only depend on the matched element. Otherwise, each ancestor
+    compound must carry a class or an ID that is not one of the `outer_qualifiers`. Bare tags
+    (e.g. `main` in `main h2`) could match the outer elements' ancestors, and so could
+    pseudo-classes (e.g. `:root`) and attributes, which are not analyzed.
+    """
+
+    if any(c in selector for c in ":[,+~"):
+        return False
+
+    *ancestors, _ = re.split(r"\s*>\s*|\s+", selector.strip())
+
+    for compound in ancestors:
+        qualifiers = set(re.findall(r"[.#][\w-]+", compound))
+
+        if not qualifiers or qualifiers & outer_qualifiers:
+            return False
+
+    return True
+
+
+@cache
+def _tree_builder() -> str:
+    """Returns the configured tree builder, or the pure-Python one if it's not installed."""
+
+    features = app.config["HTML_PARSER"]
+
+    if bs4.builder.builder_registry.lookup(features) is None:
+        logger.warning(f"HTML parser {features!r} is not available, using 'html.parser' instead.")
+        return "html.parser"
+
+    return features
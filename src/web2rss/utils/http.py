@@ -0,0 +1,95 @@
+# Copyright (C) 2024 Raphael Javaux
+# raphael@noisycamp.com
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+from functools import cache
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlparse
+
+import requests
+
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+from urllib3.util.retry import Retry
+
+from web2rss.app import app
+from web2rss.utils.metrics import inc, timer
+from web2rss.utils.throttle import THROTTLING_STATUSES, block_host, host_slot
+
+
+def http_get(url: str, interactive: bool = False, **kwargs) -> requests.Response:
+    """Sends a GET request through the shared HTTP session, with the configured timeouts.
+
+    Requests are subject to the limits of the host (see `host_slot()`), and a 429 or 503 response
+    pauses requests to that host.
+    """
+
+    kwargs.setdefault(
+        "timeout", (app.config["HTTP_CONNECT_TIMEOUT"], app.config["HTTP_READ_TIMEOUT"])
+    )
+
+    host = urlparse(url).hostname or ""
+
+    try:
+        with host_slot(host, interactive):
+            with timer("upstream"):
+                resp = http_session().get(url, **kwargs)
+    except RequestException as e:
+        inc("web2rss_upstream_errors_total", error=type(e).__name__)
+        raise
+
+    if resp.status_code >= 400:
+        inc("web2rss_upstream_errors_total", error=f"HTTP {resp.status_code}")
+
+    if resp.status_code in THROTTLING_STATUSES:
+        block_host(host, resp.headers)
+
+    return resp
+
+
+@cache
+def http_session() -> requests.Session:
+    """Returns the session shared by all outbound requests, which keeps connections alive."""
+
+    retry = Retry(
+        total=app.config["HTTP_RETRIES"],
+        backoff_factor=app.config["HTTP_RETRY_BACKOFF"],
+        # 503 is not retried, it's a throttling status (see `block_host()`).
+        status_forcelist=[502, 504],
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,  # Only retries idempotent methods.
+        raise_on_status=False,
+        # Sleeping for the duration requested by the origin would pin the worker thread.
+        respect_retry_after_header=False,
+    )
+
+    adapter = HTTPAdapter(
+        pool_connections=app.config["HTTP_POOL_CONNECTIONS"],
+        pool_maxsize=app.config["HTTP_POOL_MAXSIZE"],
+        max_retries=retry,
+    )
+
+    session = requests.Session()
+
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    session.headers["User-Agent"] = app.config["HTTP_USER_AGENT"]
+
+    # The session is shared by all users and feeds, it should not keep any cookie.
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+    return session
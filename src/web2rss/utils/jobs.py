@@ -0,0 +1,55 @@
+# Copyright (C) 2024 Raphael Javaux
+# raphael@noisycamp.com
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+from typing import Any, Callable
+
+from web2rss.app import app
+
+
+logger = logging.getLogger(__name__)
+
+
+def run_in_background(fn: Callable[..., Any], *args: Any) -> None:
+    """Runs `fn(*args)` in a background thread of the current process, within an application
+    context.
+
+    Jobs are not persisted, and are lost if the process exits before they complete.
+    """
+
+    _executor().submit(__run_job, fn, *args)
+
+
+# Created lazily, so that the threads are started in each gunicorn worker rather than in the
+# preloading master process.
+@cache
+def _executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(
+        max_workers=app.config["BACKGROUND_JOBS_CONCURRENCY"], thread_name_prefix="job"
+    )
+
+
+def __run_job(fn: Callable[..., Any], *args: Any) -> None:
+    with app.app_context():
+        try:
+            fn(*args)
+        except Exception:
+            logger.exception(f"Background job {fn.__name__} failed.")
@@ -0,0 +1,295 @@
+# Copyright (C) 2024 Raphael Javaux
+# raphael@noisycamp.com
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+import bisect
+import copy
+import fcntl
+import json
+import os
+import os.path
+import tempfile
+import threading
+import time
+
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from flask import g, has_request_context
+
+from web2rss.app import app
+from web2rss.utils.singleflight import lock_file
+
+
+# Upper bounds, in seconds, of the buckets of the duration histograms.
+_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_HELP = {
+    "web2rss_stage_duration_seconds": "Duration of the stages of the feed pipeline.",
+    "web2rss_request_duration_seconds": "Duration of the requests, by endpoint.",
+    "web2rss_responses_total": "Responses, by endpoint and status code.",
+    "web2rss_fetch_cache_total": "Webpage fetches, by fetch cache result.",
+    "web2rss_proxy_cache_total": "Settings page proxy requests, by proxy cache result.",
+    "web2rss_snapshot_total": "Feed requests, by snapshot result.",
+    "web2rss_upstream_bytes_total": "Bytes downloaded from the websites.",
+    "web2rss_upstream_errors_total": "Failed requests to the websites, by error.",
+}
+
+# Metrics of this process, indexed by name and by label string (e.g. `stage="parse"`). Histograms
+# hold the count of each bucket, then the count of larger values, then the sum of all values.
+_counters: Dict[str, Dict[str, float]] = {}
+_histograms: Dict[str, Dict[str, List[float]]] = {}
+
+_lock = threading.Lock()
+
+_flushed_at = 0.0
+_flush_lock = threading.Lock()
+
+
+def inc(name: str, value: float = 1, **labels: str) -> None:
+    """Increments a counter of this process."""
+
+    label_string = _label_string(labels)
+
+    with _lock:
+        counter = _counters.setdefault(name, {})
+        counter[label_string] = counter.get(label_string, 0) + value
+
+    _maybe_flush()
+
+
+def observe(name: str, value: float, **labels: str) -> None:
+    """Records a value, in seconds, in a histogram of this process."""
+
+    _observe(name, _label_string(labels), value)
+
+
+@contextmanager
+def timer(stage: str) -> Iterator[None]:
+    """Measures the duration of a stage of the feed pipeline.
+
+    The duration is also reported in the `Server-Timing` header of the current request, summed with
+    the other durations of the same stage. Stages might be nested (e.g. `dates` within `extract`).
+    """
+
+    started_at = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started_at
+
+        _observe("web2rss_stage_duration_seconds", f'stage="{stage}"', duration)
+
+        if has_request_context():
+            timings = g.setdefault("server_timings", {})
+            timings[stage] = timings.get(stage, 0) + duration
+
+
+def server_timing() -> Optional[str]:
+    """Returns the `Server-Timing` header value of the stages timed during the current request."""
+
+    timings = g.get("server_timings")
+
+    if not timings:
+        return None
+
+    return ", ".join(f"{stage};dur={duration * 1000:.1f}" for stage, duration in timings.items())
+
+
+def exposition() -> str:
+    """Returns the metrics of all the processes, in the Prometheus text format."""
+
+    _flush()
+
+    counters, histograms = _merge_process_files()
+
+    lines = []
+
+    for name in sorted(counters):
+        lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+        lines.append(f"# TYPE {name} counter")
+
+        for label_string, value in sorted(counters[name].items()):
+            lines.append(f"{name}{_labels(label_string)} {_number(value)}")
+
+    for name in sorted(histograms):
+        lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+        lines.append(f"# TYPE {name} histogram")
+
+        for label_string, counts in sorted(histograms[name].items()):
+            cumulative = 0
+
+            for bound, count in zip([*_BUCKETS, "+Inf"], counts[:-1]):
+                cumulative += count
+                labels = _labels(label_string, f'le="{bound}"')
+                lines.append(f"{name}_bucket{labels} {_number(cumulative)}")
+
+            lines.append(f"{name}_sum{_labels(label_string)} {_number(counts[-1])}")
+            lines.append(f"{name}_count{_labels(label_string)} {_number(cumulative)}")
+
+    return "\n".join(lines) + "\n"
+
+
+def _observe(name: str, label_string: str, value: float) -> None:
+    bucket = bisect.bisect_left(_BUCKETS, value)
+
+    with _lock:
+        histogram = _histograms.setdefault(name, {})
+
+        counts = histogram.get(label_string)
+        if counts is None:
+            counts = histogram[label_string] = [0] * (len(_BUCKETS) + 2)
+
+        counts[bucket] += 1
+        counts[-1] += value
+
+    _maybe_flush()
+
+
+def _label_string(labels: Dict[str, str]) -> str:
+    return ",".join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+
+
+def _labels(*label_strings: str) -> str:
+    label_string = ",".join(s for s in label_strings if s)
+    return f"{{{label_string}}}" if label_string else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+def _maybe_flush() -> None:
+    if time.monotonic() - _flushed_at >= app.config["METRICS_FLUSH_INTERVAL"]:
+        _flush()
+
+
+def _flush() -> None:
+    """Writes the metrics of this process to its file in `METRICS_DIR`."""
+
+    global _flushed_at
+
+    if not _flush_lock.acquire(blocking=False):  # Already being flushed by another thread.
+        return
+
+    try:
+        _flushed_at = time.monotonic()
+
+        with _lock:
+            state = json.dumps({"counters": _counters, "histograms": _histograms})
+
+        _write_atomically(_process_path(os.getpid()), state)
+    except OSError:
+        pass
+    finally:
+        _flush_lock.release()
+
+
+def _merge_process_files() -> Tuple[dict, dict]:
+    """Sums the metrics of all the processes.
+
+    The metrics of the exited processes (e.g. gunicorn workers restarted after `max_requests`) are
+    moved into a single file, so that counters never go backward.
+    """
+
+    metrics_dir = app.config["METRICS_DIR"]
+    os.makedirs(metrics_dir, exist_ok=True)
+
+    with open(os.path.join(metrics_dir, "merge.lock"), "w") as merge_lock:
+        lock_file(merge_lock)
+
+        try:
+            exited = _read_state(os.path.join(metrics_dir, "exited.json"))
+            merged = copy.deepcopy(exited)
+
+            exited_paths = []
+
+            for entry in os.scandir(metrics_dir):
+                if not (entry.name.startswith("pid-") and entry.name.endswith(".json")):
+                    continue
+
+                state = _read_state(entry.path)
+
+                _add_state(merged, state)
+
+                if not _is_running(int(entry.name[len("pid-"):-len(".json")])):
+                    _add_state(exited, state)
+                    exited_paths.append(entry.path)
+
+            if exited_paths:
+                _write_atomically(os.path.join(metrics_dir, "exited.json"), json.dumps(exited))
+
+                for path in exited_paths:
+                    os.remove(path)
+        finally:
+            fcntl.flock(merge_lock, fcntl.LOCK_UN)
+
+    return merged["counters"], merged["histograms"]
+
+
+def _read_state(path: str) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"counters": {}, "histograms": {}}
+
+
+def _add_state(total: dict, state: dict) -> None:
+    for name, values in state["counters"].items():
+        counter = total["counters"].setdefault(name, {})
+
+        for label_string, value in values.items():
+            counter[label_string] = counter.get(label_string, 0) + value
+
+    for name, values in state["histograms"].items():
+        histogram = total["histograms"].setdefault(name, {})
+
+        for label_string, counts in values.items():
+            previous = histogram.get(label_string)
+
+            if previous is None:
+                histogram[label_string] = list(counts)
+            else:
+                histogram[label_string] = [a + b for a, b in zip(previous, counts)]
+
+
+def _is_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+
+    return True
+
+
+def _process_path(pid: int) -> str:
+    return os.path.join(app.config["METRICS_DIR"], f"pid-{pid}.json")
+
+
+def _write_atomically(path: str, content: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with tempfile.NamedTemporaryFile(
+        "w", dir=os.path.dirname(path), suffix=".tmp", delete=False
+    ) as f:
+        f.write(content)
+
+    os.replace(f.name, path)
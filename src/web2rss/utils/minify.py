@@ -0,0 +1,132 @@
+# Copyright (C) 2024 Raphael Javaux
+# raphael@noisycamp.com
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+import html
+import re
+
+from typing import List
+
+import bs4
+
+
+# Elements that never contain article content.
+_REMOVED_TAGS = {
+    "audio", "button", "canvas", "embed", "head", "iframe", "input", "link", "meta", "noscript",
+    "object", "picture", "script", "select", "source", "style", "svg", "template", "textarea",
+    "video",
+}
+
+_VOID_TAGS = {"area", "br", "col", "hr", "img", "wbr"}
+
+_KEPT_ATTRS = ["id", "class"]
+
+_WHITESPACES_RE = re.compile(r"\s+")
+
+# Successive compaction levels: (number of similar siblings kept, maximum text length).
+_LEVELS = [(3, 120), (3, 60), (2, 40), (1, 20)]
+
+# Rough number of characters per token for HTML content.
+_CHARS_PER_TOKEN = 4
+
+
+def minify_dom(dom: bs4.BeautifulSoup, token_budget: int) -> str:
+    """Returns a compact HTML version of the page's <body>, fitting in `token_budget` tokens.
+
+    Only keeps the elements that could contain articles, with their `id` and `class` attributes.
+    Long runs of similar siblings (same tag and classes) are collapsed to a few representative
+    samples, and text is truncated. The compaction gets more aggressive until the page fits in the
+    budget, after which it's truncated.
+    """
+
+    root = dom.select_one("body") or dom
+    max_length = token_budget * _CHARS_PER_TOKEN
+
+    for max_siblings, max_text in _LEVELS:
+        minified = "".join(_minify(root, max_siblings, max_text))
+
+        if len(minified) <= max_length:
+            return minified
+
+    return minified[:max_length]
+
+
+def _minify(element: bs4.element.Tag, max_siblings: int, max_text: int) -> List[str]:
+    out = []
+
+    previous_signature = None
+    similar_count = 0
+    skipped_count = 0
+
+    for child in element.children:
+        if isinstance(child, bs4.element.Tag):
+            if child.name in _REMOVED_TAGS:
+                continue
+
+            signature = (child.name, tuple(child.get("class") or []))
+
+            if signature == previous_signature:
+                similar_count += 1
+            else:
+                if skipped_count:
+                    out.append(f"<!-- {skipped_count} more similar elements -->")
+
+                previous_signature = signature
+                similar_count = 1
+                skipped_count = 0
+
+            if similar_count > max_siblings:
+                skipped_count += 1
+                continue
+
+            out.append(_start_tag(child))
+
+            if child.name not in _VOID_TAGS:
+                out += _minify(child, max_siblings, max_text)
+                out.append(f"</{child.name}>")
+        elif type(child) is bs4.element.NavigableString:  # Skips comments, CDATA ...
+            text = _WHITESPACES_RE.sub(" ", child).strip()
+
+            if not text:
+                continue
+
+            if len(text) > max_text:
+                text = text[:max_text] + "…"
+
+            out.append(html.escape(text, quote=False))
+
+    if skipped_count:
+        out.append(f"<!-- {skipped_count} more similar elements -->")
+
+    return out
+
+
+def _start_tag(element: bs4.element.Tag) -> str:
+    attrs = []
+
+    for name in _KEPT_ATTRS:
+        value = element.get(name)
+
+        if not value:
+            continue
+
+        if isinstance(value, list):
+            value = " ".join(value)
+
+        attrs.append(f' {name}="{html.escape(value)}"')
+
+    return f"<{element.name}{''.join(attrs)}>"
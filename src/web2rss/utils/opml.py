@@ -0,0 +1,186 @@
+# Copyright (C) 2024 Raphael Javaux
+# raphael@noisycamp.com
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+import xml.etree.ElementTree as ET
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from web2rss.app import app, db
+from web2rss.models import Feed
+from web2rss.utils.feed import create_feed
+
+
+# Feed settings are exported as namespaced attributes of the <outline> elements, so that they can
+# be imported back into another instance.
+_NAMESPACE = "https://github.com/RaphaelJ/web2rss"
+
+_SETTINGS = {
+    "article": "article_selector",
+    "link": "link_selector",
+    "title": "title_selector",
+    "date": "date_selector",
+    "author": "author_selector",
+    "summary": "summary_selector",
+    "dateLanguages": "date_languages",
+    "dateOrder": "date_order",
+    "nextPage": "next_page_selector",
+}
+
+_INTEGER_SETTINGS = {
+    "maxPages": "max_pages",
+    "refreshInterval": "refresh_interval",
+}
+
+
+@dataclass
+class ImportResult:
+    url: str
+
+    # `None` if the feed already existed.
+    feed_id: Optional[int]
+
+    status: str
+
+
+def export_opml(feed_url: Callable[[Feed], str]) -> bytes:
+    """Exports all the feeds as an OPML 2.0 document.
+
+    `feed_url` returns the absolute URL of the RSS document of a feed.
+    """
+
+    with db.session.begin():
+        feeds = db.session.query(Feed).order_by(Feed.id).all()
+
+    ET.register_namespace("web2rss", _NAMESPACE)
+
+    opml = ET.Element("opml", version="2.0")
+
+    head = ET.SubElement(opml, "head")
+    ET.SubElement(head, "title").text = "Web2RSS feeds"
+    ET.SubElement(head, "dateCreated").text = format_datetime(datetime.now(tz=timezone.utc))
+
+    body = ET.SubElement(opml, "body")
+
+    for feed in feeds:
+        outline = ET.SubElement(
+            body, "outline",
+            type="rss", text=feed.page_title, title=feed.page_title,
+            xmlUrl=feed_url(feed), htmlUrl=feed.url,
+        )
+
+        for name, column in _SETTINGS.items():
+            value = getattr(feed, column)
+
+            if value is not None:
+                outline.set(f"{{{_NAMESPACE}}}{name}", value)
+
+        for name, column in _INTEGER_SETTINGS.items():
+            value = getattr(feed, column)
+
+            if value is not None:
+                outline.set(f"{{{_NAMESPACE}}}{name}", str(value))
+
+    return ET.tostring(opml, encoding="utf-8", xml_declaration=True)
+
+
+def import_opml(
+    opml: bytes, concurrency: int, on_result: Callable[[ImportResult], None]
+) -> List[ImportResult]:
+    """Creates a feed for each webpage (`htmlUrl`) of the OPML document that has no feed yet.
+
+    Outlines exported by `export_opml` keep their settings. The selectors of the other feeds are
+    guessed, with at most `concurrency` feeds being created at the same time.
+    """
+
+    with db.session.begin():
+        known_urls = {url for url, in db.session.query(Feed.url)}
+
+    results = []
+    pending_ids = []
+
+    for url, settings in _parse_outlines(opml):
+        if url in known_urls:
+            result = ImportResult(url, None, "exists")
+            results.append(result)
+            on_result(result)
+            continue
+
+        known_urls.add(url)
+
+        feed = Feed(url=url, **settings)
+
+        if feed.has_required_selectors():
+            feed.status = Feed.STATUS_READY
+        else:
+            feed.status = Feed.STATUS_PENDING
+
+        with db.session.begin():
+            db.session.add(feed)
+
+        if feed.status == Feed.STATUS_PENDING:
+            pending_ids.append(feed.id)
+        else:
+            result = ImportResult(url, feed.id, feed.status)
+            results.append(result)
+            on_result(result)
+
+    def create(feed_id: int) -> ImportResult:
+        with app.app_context():
+            create_feed(feed_id)
+
+            with db.session.begin():
+                feed = db.session.get(Feed, feed_id)
+
+        result = ImportResult(feed.url, feed_id, feed.status)
+        on_result(result)
+        return result
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="import") as executor:
+        results.extend(executor.map(create, pending_ids))
+
+    return results
+
+
+def _parse_outlines(opml: bytes) -> Iterator[Tuple[str, Dict[str, str]]]:
+    """Yields the webpage URL and the feed attributes of every outline, including nested ones."""
+
+    for outline in ET.fromstring(opml).iter("outline"):
+        url = outline.get("htmlUrl")
+
+        if not url or not url.startswith(("http://", "https://")):
+            continue
+
+        settings = {"page_title": outline.get("title") or outline.get("text") or url}
+
+        for name, column in _SETTINGS.items():
+            value = outline.get(f"{{{_NAMESPACE}}}{name}")
+
+            if value:
+                settings[column] = value
+
+        for name, column in _INTEGER_SETTINGS.items():
+            value = outline.get(f"{{{_NAMESPACE}}}{name}", "")
+
+            if value.isdigit() and int(value) >= 1:
+                settings[column] = int(value)
+
+        yield url, settings
@@ -16,49 +16,346 @@
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 
-import os.path
+import math
+import re
 
-from typing import Callable, Optional, Mapping
+from typing import Callable, Iterator, Mapping, Optional
+from urllib.parse import urlparse
 
-import bs4
 import requests
 
 from flask import Response
+from requests.exceptions import RequestException
 
+from web2rss.app import app
+from web2rss.utils import proxy_cache
+from web2rss.utils.http import http_get
+from web2rss.utils.metrics import inc, timer
+from web2rss.utils.throttle import Throttled
 
-def http_proxy(proxied_url: Callable[[str], str], url: str, params: Mapping[str, str]) -> Response:
-    resp = requests.get(url, params=params, allow_redirects=False)
 
-    headers = _proxied_headers(proxied_url, resp.headers)
+# Request headers forwarded to the website, so that it can answer with a `304 Not Modified`.
+_FORWARDED_HEADERS = ["if-none-match", "if-modified-since"]
+
+# Response headers forwarded to the client. Other headers, such as `Set-Cookie` or security
+# policies, would apply to the web2rss origin and are dropped.
+_PROXIED_HEADERS = [
+    "cache-control",
+    "content-encoding",
+    "content-length",
+    "content-type",
+    "etag",
+    "expires",
+    "last-modified",
+    "location",
+]
+
+_CHUNK_SIZE = 64 * 1024
+
+
+class BodyTooLargeError(Exception):
+    pass
+
+
+def http_proxy(
+    proxied_url: Callable[[str], str],
+    url: str,
+    params: Mapping[str, str],
+    request_headers: Mapping[str, str],
+) -> Response:
+    """Proxies a GET request to the website.
+
+    HTML pages are rewritten to go through the proxy. Other responses are streamed to the client
+    as-is, so that large assets never sit in memory. Bodies larger than `PROXY_MAX_BODY_SIZE` are
+    rejected (or truncated if their size is not known upfront).
+
+    Cacheable responses are stored in the proxy cache, after being rewritten for HTML pages.
+    """
+
+    key = proxy_cache.cache_key(proxied_url(""), url, params)
+
+    cached = proxy_cache.get(key)
+    if cached is not None:
+        inc("web2rss_proxy_cache_total", result="hit")
+        return _cached_response(cached, request_headers)
+
+    inc("web2rss_proxy_cache_total", result="miss")
+
+    headers = {
+        name: value
+        for name, value in request_headers.items()
+        if name.lower() in _FORWARDED_HEADERS
+    }
+
+    try:
+        resp = http_get(
+            url, interactive=True,
+            params=params, headers=headers, allow_redirects=False, stream=True,
+        )
+    except Throttled as e:
+        return Response(
+            "The website is rate limiting our requests.", 503,
+            headers={"retry-after": str(math.ceil(e.retry_after))},
+        )
+    except RequestException as _e:
+        return Response("Unable to reach the website.", 502)
+
+    max_size = app.config["PROXY_MAX_BODY_SIZE"]
+
+    content_length = resp.headers.get("content-length")
+    if content_length is not None and content_length.isdigit() and int(content_length) > max_size:
+        resp.close()
+        return Response("The response of the website is too large.", 502)
 
     content_type = resp.headers.get("content-type")
+    is_html = content_type is not None and content_type.startswith("text/html")
+
+    if is_html and resp.status_code != 304:
+        # Only HTML pages are decoded and rewritten.
+        try:
+            body = _read_capped(resp, max_size)
+        except RequestException as _e:
+            return Response("Unable to reach the website.", 502)
+
+        if body is None:
+            return Response("The response of the website is too large.", 502)
+
+        encoding = resp.encoding if "charset" in content_type.lower() else "utf-8"
+        html = body.decode(encoding or "utf-8", errors="replace")
+
+        headers = _proxied_headers(proxied_url, resp.headers, passthrough=False)
+        headers["content-type"] = "text/html; charset=utf-8"
+
+        with timer("rewrite"):
+            content = _proxied_html(proxied_url, url, html).encode("utf-8")
 
-    if content_type is not None and content_type.startswith("text/html"):
-        content = _proxied_html(proxied_url, resp.text)
+        ttl = _cache_ttl(resp)
+        if ttl is not None:
+            proxy_cache.put(key, resp.status_code, headers, ttl, content)
+
+        response = Response(content, resp.status_code, headers)
+    else:
+        headers = _proxied_headers(proxied_url, resp.headers, passthrough=True)
+
+        body = _stream_capped(resp, max_size)
+
+        ttl = _cache_ttl(resp)
+        if ttl is not None:
+            body = proxy_cache.tee(key, resp.status_code, headers, ttl, body)
+
+        response = Response(body, resp.status_code, headers, direct_passthrough=True)
+
+    if ttl is not None:
+        response.headers["cache-control"] = f"private, max-age={ttl}"
+
+    return response
+
+
+def _cached_response(
+    cached: proxy_cache.CachedResponse, request_headers: Mapping[str, str]
+) -> Response:
+    etag = cached.headers.get("etag")
+
+    if etag is not None and request_headers.get("if-none-match") == etag:
+        cached.body.close()
+        status = 304
+        body = b""
     else:
-        content = resp.content
+        status = cached.status
+        body = cached.stream()
+
+    response = Response(body, status, cached.headers, direct_passthrough=True)
+    response.headers["cache-control"] = f"private, max-age={cached.ttl()}"
+
+    return response
+
+
+def _cache_ttl(resp: requests.Response) -> Optional[int]:
+    """Returns for how long the response should be cached, or `None` if it's not cacheable."""
+
+    if resp.status_code != 200:
+        return None
+
+    return proxy_cache.freshness(resp.headers)
+
+
+def _read_capped(resp: requests.Response, max_size: int) -> Optional[bytes]:
+    """Reads the decoded response body, or returns `None` if it's larger than `max_size`."""
+
+    chunks = []
+    size = 0
+
+    try:
+        for chunk in resp.iter_content(_CHUNK_SIZE):
+            size += len(chunk)
+
+            if size > max_size:
+                return None
+
+            chunks.append(chunk)
+    finally:
+        resp.close()
+
+        inc("web2rss_upstream_bytes_total", size, source="proxy")
+
+    return b"".join(chunks)
+
+
+def _stream_capped(resp: requests.Response, max_size: int) -> Iterator[bytes]:
+    """Streams the raw (still encoded) response body.
+
+    Raises `BodyTooLargeError` once more than `max_size` bytes have been streamed. As the response
+    has already started, the WSGI server then aborts the connection, and the client notices the
+    truncated body.
+    """
+
+    size = 0
+
+    try:
+        for chunk in resp.raw.stream(_CHUNK_SIZE, decode_content=False):
+            size += len(chunk)
+
+            if size > max_size:
+                raise BodyTooLargeError(f"{resp.url} is larger than {max_size} bytes.")
+
+            yield chunk
+    finally:
+        resp.close()
+
+        inc("web2rss_upstream_bytes_total", size, source="proxy")
+
+
+def _proxied_headers(
+    proxied_url: Callable[[str], str], headers: Mapping[str, str], passthrough: bool
+) -> Mapping[str, str]:
+    """Returns the response headers to forward to the client.
+
+    If `passthrough` is set, the body is forwarded as-is and keeps its encoding and length.
+    """
+
+    allowed = set(_PROXIED_HEADERS)
+
+    if not passthrough:
+        allowed -= {"content-encoding", "content-length", "content-type"}
+
+    proxied_headers = {
+        name.lower(): value
+        for name, value in headers.items()
+        if name.lower() in allowed
+    }
+
+    location = headers.get("location")
+    if location is not None and location.startswith("/") and not location.startswith("//"):
+        proxied_headers["location"] = proxied_url(location[1:])
+
+    return proxied_headers
+
+
+def _proxied_html(proxied_url: Callable[[str], str], url: str, html: str) -> str:
+    """Transforms the URLs pointing to the website to their proxied equivalents in an HTML page.
+
+    Rewrites root-relative, protocol-relative and absolute URLs in URL attributes, `srcset`, inline
+    styles and `<style>` elements in a single pass over the page, leaving the rest of the markup
+    untouched.
+    """
+
+    rewriter = _URLRewriter(proxied_url(""), urlparse(url).netloc)
+    return _HTML_TOKEN_RE.sub(rewriter.rewrite_token, html)
+
+
+# Matches comments, <script> and <style> elements, and other start tags. Quoted attribute values
+# may contain `>` (e.g. `title="a > b"`).
+_HTML_TOKEN_RE = re.compile(
+    r"""<!--.*?-->"""
+    r"""|<(?P<raw>script|style)\b(?P<raw_attrs>(?:"[^"]*"|'[^']*'|[^'">])*)>"""
+    r"""(?P<raw_content>.*?)</(?P=raw)\s*>"""
+    r"""|<[a-zA-Z](?:"[^"]*"|'[^']*'|[^'">])*>""",
+    re.DOTALL | re.IGNORECASE,
+)
+
+_HTML_ATTR_RE = re.compile(
+    r"""(?P<name>[^\s"'<>/=]+)(?P<eq>\s*=\s*)"""
+    r"""(?:"(?P<dq>[^"]*)"|'(?P<sq>[^']*)'|(?P<uq>[^\s"'=<>`]+))"""
+)
+
+_CSS_URL_RE = re.compile(
+    r"""url\(\s*(?P<quote>['"]|&quot;|&#39;|)(?P<url>.*?)(?P=quote)\s*\)""", re.IGNORECASE
+)
+
+_SRCSET_URL_RE = re.compile(r"(?P<sep>^|,)(?P<space>\s*)(?P<url>[^\s,]+)")
+
+_URL_ATTRS = {"href", "src", "action", "formaction", "poster", "data"}
+
+
+class _URLRewriter:
+    def __init__(self, prefix: str, netloc: str):
+        self._prefix = prefix
+        self._netloc = netloc.lower()
+
+    def rewrite_token(self, match: re.Match) -> str:
+        token = match.group(0)
+
+        if token.startswith("<!--"):
+            return token
+
+        raw = match.group("raw")
+
+        if raw is None:
+            return self._rewrite_attrs(token)
+
+        start_tag = self._rewrite_attrs(f"<{raw}{match.group('raw_attrs')}>")
+        content = match.group("raw_content")
+
+        if raw.lower() == "style":
+            content = _CSS_URL_RE.sub(self._rewrite_css_url, content)
+
+        return f"{start_tag}{content}</{raw}>"
 
-    return Response(content, resp.status_code, headers, content_type=content_type)
+    def _rewrite_attrs(self, tag: str) -> str:
+        return _HTML_ATTR_RE.sub(self._rewrite_attr, tag)
 
+    def _rewrite_attr(self, match: re.Match) -> str:
+        name = match.group("name").lower()
 
-def _proxied_headers(proxied_url: Callable[[str], str], headers: Mapping[str, str]):
-    if "location" in headers:
-        headers["location"] = proxied_url(headers["location"][:1])
+        if match.group("dq") is not None:
+            quote, value = '"', match.group("dq")
+        elif match.group("sq") is not None:
+            quote, value = "'", match.group("sq")
+        else:
+            quote, value = "", match.group("uq")
 
-    for excluded in ["content-encoding", "content-length", "transfer-encoding", "connection"]:
-        if excluded in headers:
-            del headers[excluded]
+        if name in _URL_ATTRS:
+            new_value = self._rewrite_url(value)
+        elif name == "srcset" and "data:" not in value:
+            new_value = _SRCSET_URL_RE.sub(self._rewrite_srcset_url, value)
+        elif name == "style":
+            new_value = _CSS_URL_RE.sub(self._rewrite_css_url, value)
+        else:
+            return match.group(0)
 
+        if new_value == value:
+            return match.group(0)
 
-def _proxied_html(proxied_url: Callable[[str], str], html: str) -> str:
-    """Transforms absolute URLs to their proxied equivalents in an HTML page."""
+        return f"{match.group('name')}{match.group('eq')}{quote}{new_value}{quote}"
 
-    dom = bs4.BeautifulSoup(html, "html.parser")
+    def _rewrite_srcset_url(self, match: re.Match) -> str:
+        return f"{match.group('sep')}{match.group('space')}{self._rewrite_url(match.group('url'))}"
 
-    for link in dom.select("[href^='/']"):
-        link["href"] = proxied_url(link["href"][1:])
+    def _rewrite_css_url(self, match: re.Match) -> str:
+        quote = match.group("quote")
+        return f"url({quote}{self._rewrite_url(match.group('url'))}{quote})"
 
-    for media in dom.select("[src^='/']"):
-        media["src"] = proxied_url(media["src"][1:])
+    def _rewrite_url(self, url: str) -> str:
+        if url.startswith("//"):
+            netloc, _, path = url[2:].partition("/")
+        elif url.startswith("/"):
+            return self._prefix + url[1:]
+        elif url[:8].lower().startswith(("http://", "https://")):
+            netloc, _, path = url.partition("://")[2].partition("/")
+        else:  # Relative URLs are resolved by the browser.
+            return url
 
-    return str(dom)
+        if netloc.lower() == self._netloc:
+            return self._prefix + path
+        else:
+            return url
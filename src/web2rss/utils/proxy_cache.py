@@ -0,0 +1,302 @@
+# Copyright (C) 2024 Raphael Javaux
+# raphael@noisycamp.com
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+import hashlib
+import json
+import logging
+import os
+import os.path
+import tempfile
+import time
+
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import BinaryIO, Dict, Iterator, Mapping, Optional, Tuple
+from urllib.parse import urlencode
+
+from web2rss.app import app
+
+
+logger = logging.getLogger(__name__)
+
+
+_CHUNK_SIZE = 64 * 1024
+
+# Response headers stored with the cached body. `Date`, `Expires` and `Cache-Control` would be
+# stale when served from the cache, and other headers are not forwarded by the proxy.
+_CACHED_HEADERS = ["content-encoding", "content-length", "content-type", "etag", "last-modified"]
+
+# Minimum number of seconds between two scans of the cache directory by a process.
+_EVICTION_INTERVAL = 30
+
+_last_eviction = 0.0
+
+
+@dataclass
+class CachedResponse:
+    status: int
+    headers: Dict[str, str]
+    expires_at: float
+
+    body: BinaryIO
+
+    def ttl(self) -> int:
+        return max(0, int(self.expires_at - time.time()))
+
+    def stream(self) -> Iterator[bytes]:
+        try:
+            while chunk := self.body.read(_CHUNK_SIZE):
+                yield chunk
+        finally:
+            self.body.close()
+
+
+def cache_key(namespace: str, url: str, params: Mapping[str, str]) -> str:
+    """Identifies a proxied response by its upstream URL and query string."""
+
+    query = urlencode(sorted(params.items(), key=lambda param: param[0]))
+    return hashlib.sha256(f"{namespace}\n{url}?{query}".encode("utf-8")).hexdigest()
+
+
+def freshness(headers: Mapping[str, str]) -> Optional[int]:
+    """Returns the number of seconds a response can be cached for, or `None` if not cacheable.
+
+    Follows the `Cache-Control` and `Expires` headers, or `PROXY_CACHE_DEFAULT_TTL` if the response
+    specifies neither. Responses setting cookies are never cached, as they are specific to a user.
+    """
+
+    if "set-cookie" in headers:
+        return None
+
+    directives = {}
+    for directive in headers.get("cache-control", "").split(","):
+        name, _, value = directive.strip().partition("=")
+        directives[name.lower()] = value.strip('"')
+
+    if {"no-store", "no-cache", "private"} & directives.keys():
+        return None
+
+    for name in ["s-maxage", "max-age"]:
+        if name in directives:
+            try:
+                max_age = int(directives[name])
+            except ValueError:
+                return None
+
+            return max_age if max_age > 0 else None
+
+    if "expires" in headers:
+        try:
+            expires = parsedate_to_datetime(headers["expires"]).timestamp()
+        except (TypeError, ValueError):
+            return None
+
+        max_age = int(expires - time.time())
+        return max_age if max_age > 0 else None
+
+    return app.config["PROXY_CACHE_DEFAULT_TTL"] or None
+
+
+def get(key: str) -> Optional[CachedResponse]:
+    """Returns the cached response if it exists and is still fresh."""
+
+    meta_path, body_path = _entry_paths(key)
+
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+        if meta["expires_at"] <= time.time():
+            return None
+
+        body = open(body_path, "rb")
+    except (OSError, ValueError, KeyError):
+        return None
+
+    # Marks the entry as recently used.
+    try:
+        os.utime(body_path)
+    except OSError:
+        pass
+
+    return CachedResponse(meta["status"], meta["headers"], meta["expires_at"], body)
+
+
+def put(key: str, status: int, headers: Mapping[str, str], ttl: int, body: bytes) -> None:
+    """Caches a response, evicting the least recently used entries if needed."""
+
+    writer = _EntryWriter(key, status, headers, ttl)
+    writer.write(body)
+    writer.commit()
+
+
+def tee(
+    key: str, status: int, headers: Mapping[str, str], ttl: int, chunks: Iterator[bytes]
+) -> Iterator[bytes]:
+    """Yields the chunks of a streamed response while caching it.
+
+    The response is only cached if it's been fully streamed.
+    """
+
+    writer = _EntryWriter(key, status, headers, ttl)
+
+    chunks = iter(chunks)
+
+    try:
+        # Looks one chunk ahead, so that the entry is committed before the last chunk is yielded,
+        # as some clients stop reading once they got `Content-Length` bytes.
+        chunk = next(chunks, None)
+
+        while chunk is not None:
+            writer.write(chunk)
+
+            next_chunk = next(chunks, None)
+            if next_chunk is None:
+                writer.commit()
+
+            yield chunk
+
+            chunk = next_chunk
+    finally:
+        writer.discard()
+
+
+class _EntryWriter:
+    def __init__(self, key: str, status: int, headers: Mapping[str, str], ttl: int):
+        self._key = key
+        self._meta = {
+            "status": status,
+            "headers": {
+                name.lower(): value
+                for name, value in headers.items()
+                if name.lower() in _CACHED_HEADERS
+            },
+            "expires_at": time.time() + ttl,
+        }
+
+        self._size = 0
+        self._file = None
+
+        try:
+            self._file = tempfile.NamedTemporaryFile(dir=_cache_dir(), suffix=".tmp", delete=False)
+        except OSError as e:
+            logger.warning(f"Unable to write to the proxy cache: {e}")
+
+    def write(self, chunk: bytes) -> None:
+        if self._file is None:
+            return
+
+        self._size += len(chunk)
+
+        if self._size > app.config["PROXY_CACHE_MAX_SIZE"]:
+            self.discard()
+        else:
+            self._file.write(chunk)
+
+    def commit(self) -> None:
+        if self._file is None:
+            return
+
+        meta_path, body_path = _entry_paths(self._key)
+
+        try:
+            self._file.close()
+            os.replace(self._file.name, body_path)
+
+            with tempfile.NamedTemporaryFile(
+                "w", dir=_cache_dir(), suffix=".tmp", delete=False
+            ) as f:
+                json.dump(self._meta, f)
+            os.replace(f.name, meta_path)
+        except OSError as e:
+            logger.warning(f"Unable to write to the proxy cache: {e}")
+
+        self._file = None
+
+        _maybe_evict()
+
+    def discard(self) -> None:
+        if self._file is None:
+            return
+
+        self._file.close()
+
+        try:
+            os.remove(self._file.name)
+        except OSError:
+            pass
+
+        self._file = None
+
+
+def _maybe_evict() -> None:
+    """Evicts entries at most every `_EVICTION_INTERVAL` seconds, as listing the cache directory is
+    slow once it holds many entries."""
+
+    global _last_eviction
+
+    now = time.monotonic()
+
+    if now - _last_eviction < _EVICTION_INTERVAL:
+        return
+
+    _last_eviction = now
+
+    _evict()
+
+
+def _evict() -> None:
+    """Removes the least recently used entries until the cache fits in `PROXY_CACHE_MAX_SIZE`."""
+
+    entries = []
+    total_size = 0
+
+    with os.scandir(_cache_dir()) as it:
+        for entry in it:
+            if entry.name.endswith(".body"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.name[:-len(".body")]))
+                total_size += stat.st_size
+
+    max_size = app.config["PROXY_CACHE_MAX_SIZE"]
+
+    if total_size <= max_size:
+        return
+
+    for _mtime, size, key in sorted(entries):
+        for path in _entry_paths(key):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+        total_size -= size
+
+        if total_size <= max_size:
+            break
+
+
+def _entry_paths(key: str) -> Tuple[str, str]:
+    cache_dir = _cache_dir()
+    return os.path.join(cache_dir, f"{key}.json"), os.path.join(cache_dir, f"{key}.body")
+
+
+def _cache_dir() -> str:
+    cache_dir = app.config["PROXY_CACHE_DIR"]
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
@@ -0,0 +1,194 @@
+# Copyright (C) 2024 Raphael Javaux
+# raphael@noisycamp.com
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+import logging
+import time
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import or_
+
+from web2rss.app import app, db
+from web2rss.models import Feed, FeedItem, FeedSnapshot
+from web2rss.utils.dates import as_utc
+from web2rss.utils.feed import refresh_feed
+
+
+logger = logging.getLogger(__name__)
+
+
+# Maximum number of seconds between two scans of the feed table.
+_POLL_INTERVAL = 60
+
+
+def run_refresher(concurrency: int) -> None:
+    """Periodically refreshes the snapshots of all feeds, off the request path.
+
+    Each feed is refreshed every `Feed.refresh_interval` seconds (or `FEED_REFRESH_INTERVAL` if
+    unset), with at most `concurrency` feeds being refreshed at the same time.
+    """
+
+    # Feeds being refreshed or waiting for a worker, so that a slow feed is never refreshed twice
+    # concurrently while the others keep being refreshed on time.
+    in_flight: Dict[int, Future] = {}
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="refresh") as executor:
+        while True:
+            started_at = time.monotonic()
+
+            in_flight = {
+                feed_id: future for feed_id, future in in_flight.items() if not future.done()
+            }
+
+            feed_ids = [feed_id for feed_id in _due_feed_ids() if feed_id not in in_flight]
+
+            if feed_ids:
+                logger.info(f"Refreshing {len(feed_ids)} feed(s).")
+
+            for feed_id in feed_ids:
+                in_flight[feed_id] = executor.submit(_refresh_feed_id, feed_id)
+
+            elapsed = time.monotonic() - started_at
+            time.sleep(max(0, _POLL_INTERVAL - elapsed))
+
+
+@dataclass
+class RefreshResult:
+    feed_id: int
+    url: str
+
+    # Number of seconds spent refreshing the feed.
+    elapsed: float
+
+    # Number of articles currently in the webpages, and of items stored for the feed.
+    articles: Optional[int]
+    items: Optional[int]
+
+    # Why the refresh failed, `None` if it succeeded.
+    error: Optional[str]
+
+
+def refresh_all(
+    concurrency: int, on_result: Callable[[RefreshResult], None]
+) -> List[RefreshResult]:
+    """Refreshes all the valid feeds once, with at most `concurrency` feeds being refreshed at the
+    same time, regardless of the age of their snapshot."""
+
+    with app.app_context():
+        with db.session.begin():
+            feeds = db.session.query(Feed).order_by(Feed.id).all()
+
+    feed_ids = [feed.id for feed in feeds if feed.has_required_selectors()]
+
+    def refresh(feed_id: int) -> RefreshResult:
+        result = _refresh_feed_once(feed_id)
+        on_result(result)
+        return result
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="refresh") as executor:
+        return list(executor.map(refresh, feed_ids))
+
+
+def _refresh_feed_once(feed_id: int) -> RefreshResult:
+    with app.app_context():
+        with db.session.begin():
+            feed = db.session.get(Feed, feed_id)
+
+        if feed is None:  # Deleted in the meantime.
+            return RefreshResult(feed_id, "", 0.0, None, None, "deleted feed")
+
+        started_at = time.monotonic()
+
+        def result(error: Optional[str], articles: Optional[int] = None) -> RefreshResult:
+            elapsed = time.monotonic() - started_at
+
+            if error is None:
+                with db.session.begin():
+                    items = db.session.query(FeedItem).filter(FeedItem.feed_id == feed_id).count()
+            else:
+                items = None
+
+            return RefreshResult(feed_id, feed.url, elapsed, articles, items, error)
+
+        if not feed.has_required_selectors():
+            return result("invalid feed")
+
+        try:
+            snapshot = refresh_feed(feed)
+        except Exception as e:
+            logger.exception(f"Failed to refresh feed {feed_id}.")
+            return result(repr(e))
+
+        if snapshot is None:
+            return result("unreachable webpage")
+
+        return result(None, snapshot.articles)
+
+
+def _due_feed_ids() -> List[int]:
+    """Returns the feeds whose snapshot is missing or older than their refresh interval."""
+
+    # Only queries the columns required, as loading the snapshots would load their documents.
+    with app.app_context():
+        with db.session.begin():
+            rows = db.session.query(Feed.id, Feed.refresh_interval, FeedSnapshot.refreshed_at). \
+                outerjoin(FeedSnapshot, FeedSnapshot.feed_id == Feed.id).                      \
+                filter(Feed.article_selector != "").                                           \
+                filter(or_(Feed.title_selector != "", Feed.summary_selector != "")).           \
+                all()
+
+        default_interval = app.config["FEED_REFRESH_INTERVAL"]
+
+    now = datetime.now(tz=timezone.utc)
+
+    due = []
+
+    for feed_id, refresh_interval, refreshed_at in rows:
+        interval = timedelta(seconds=refresh_interval or default_interval)
+
+        if refreshed_at is None or now - as_utc(refreshed_at) >= interval:
+            due.append(feed_id)
+
+    return due
+
+
+def _refresh_feed_id(feed_id: int) -> None:
+    with app.app_context():
+        with db.session.begin():
+            feed = db.session.get(Feed, feed_id)
+
+        if feed is None:  # Deleted in the meantime.
+            return
+
+        started_at = time.monotonic()
+
+        try:
+            snapshot = refresh_feed(feed)
+        except Exception:
+            logger.exception(f"Failed to refresh feed {feed_id}.")
+            return
+
+        elapsed = time.monotonic() - started_at
+
+        if snapshot is not None:
+            logger.info(f"Refreshed feed {feed_id} in {elapsed:.2f}s.")
+        else:
+            logger.warning(f"Feed {feed_id} is invalid or unreachable ({elapsed:.2f}s).")
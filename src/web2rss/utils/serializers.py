@@ -0,0 +1,250 @@
+# Copyright (C) 2024 Raphael Javaux
+# raphael@noisycamp.com
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+import json
+import re
+
+from datetime import datetime
+from email.utils import format_datetime
+from typing import Iterator, List, Optional
+from xml.sax.saxutils import escape, quoteattr
+
+from web2rss.models import Feed, FeedItem
+from web2rss.utils.dates import as_utc
+
+
+_GENERATOR = "Web2RSS"
+
+# Characters not allowed in XML 1.0 documents, which webpages sometimes contain.
+_INVALID_XML_CHARS_RE = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+
+def rss(
+    feed: Feed, items: List[FeedItem], self_url: Optional[str], updated: datetime,
+    pretty: bool = False,
+) -> Iterator[bytes]:
+    """Serializes the items as a RSS 2.0 document, one chunk per item."""
+
+    w = _XMLWriter(pretty)
+
+    w.raw("<?xml version='1.0' encoding='UTF-8'?>")
+    w.open(
+        "rss",
+        'xmlns:atom="http://www.w3.org/2005/Atom" '
+        'xmlns:content="http://purl.org/rss/1.0/modules/content/" '
+        'xmlns:dc="http://purl.org/dc/elements/1.1/" '
+        'version="2.0"'
+    )
+    w.open("channel")
+    w.element("title", feed.page_title)
+    w.element("link", feed.url)
+    w.element("description", _description(feed))
+
+    if self_url is not None:
+        w.empty("atom:link", f"href={quoteattr(_xml_text(self_url))} rel=\"self\"")
+
+    w.element("docs", "http://www.rssboard.org/rss-specification")
+    w.element("generator", _GENERATOR)
+    w.element("lastBuildDate", format_datetime(as_utc(updated)))
+
+    yield w.flush()
+
+    for item in items:
+        w.open("item")
+
+        if item.title:
+            w.element("title", item.title)
+
+        if item.link:
+            w.element("link", item.link)
+
+        if item.summary:
+            w.cdata("description", item.summary)
+
+        if item.author:
+            # RSS' <author> requires an email address.
+            w.element("dc:creator", item.author)
+
+        w.element("guid", item.guid, 'isPermaLink="false"')
+        w.element("pubDate", format_datetime(as_utc(item.published_at)))
+        w.close("item")
+
+        yield w.flush()
+
+    w.close("channel")
+    w.close("rss")
+
+    yield w.flush(final=True)
+
+
+def atom(
+    feed: Feed, items: List[FeedItem], self_url: Optional[str], updated: datetime,
+    pretty: bool = False,
+) -> Iterator[bytes]:
+    """Serializes the items as an Atom 1.0 document, one chunk per item."""
+
+    w = _XMLWriter(pretty)
+
+    w.raw("<?xml version='1.0' encoding='UTF-8'?>")
+    w.open("feed", 'xmlns="http://www.w3.org/2005/Atom"')
+    w.element("id", feed.url)
+    w.element("title", feed.page_title)
+    w.element("subtitle", _description(feed))
+    w.empty("link", f"href={quoteattr(_xml_text(feed.url))} rel=\"alternate\"")
+
+    if self_url is not None:
+        w.empty("link", f"href={quoteattr(_xml_text(self_url))} rel=\"self\"")
+
+    w.element("updated", as_utc(updated).isoformat())
+    w.element("generator", _GENERATOR)
+
+    yield w.flush()
+
+    for item in items:
+        published_at = as_utc(item.published_at).isoformat()
+
+        w.open("entry")
+        w.element("id", f"urn:web2rss:{item.guid}")
+        w.element("title", item.title or "")
+
+        if item.link:
+            w.empty("link", f"href={quoteattr(_xml_text(item.link))} rel=\"alternate\"")
+
+        w.element("published", published_at)
+        w.element("updated", published_at)
+
+        if item.author:
+            w.open("author")
+            w.element("name", item.author)
+            w.close("author")
+
+        if item.summary:
+            w.element("content", item.summary, 'type="text"')
+
+        w.close("entry")
+
+        yield w.flush()
+
+    w.close("feed")
+
+    yield w.flush(final=True)
+
+
+def json_feed(
+    feed: Feed, items: List[FeedItem], self_url: Optional[str], updated: datetime,
+    pretty: bool = False,
+) -> Iterator[bytes]:
+    """Serializes the items as a JSON Feed 1.1 document, one chunk per item."""
+
+    indent = 2 if pretty else None
+    separators = (",", ": ") if pretty else (",", ":")
+
+    header = {
+        "version": "https://jsonfeed.org/version/1.1",
+        "title": feed.page_title,
+        "home_page_url": feed.url,
+        "description": _description(feed),
+    }
+
+    if self_url is not None:
+        header["feed_url"] = self_url
+
+    # Opens the items array in place of the closing brace of the header object.
+    head = json.dumps(header, indent=indent, separators=separators)
+    yield (head[:-1].rstrip() + (',\n  "items": [' if pretty else ',"items":[')).encode("utf-8")
+
+    for i, item in enumerate(items):
+        entry = {"id": item.guid}
+
+        if item.link:
+            entry["url"] = item.link
+
+        if item.title:
+            entry["title"] = item.title
+
+        entry["content_text"] = item.summary or ""
+        entry["date_published"] = as_utc(item.published_at).isoformat()
+
+        if item.author:
+            entry["authors"] = [{"name": item.author}]
+
+        chunk = json.dumps(entry, indent=indent, separators=separators)
+
+        if pretty:
+            chunk = "\n" + "\n".join("    " + line for line in chunk.splitlines())
+
+        yield (("," if i > 0 else "") + chunk).encode("utf-8")
+
+    yield ("\n  ]\n}\n" if pretty else "]}").encode("utf-8")
+
+
+def _description(feed: Feed) -> str:
+    return f"RSS feed generated from {feed.url}."
+
+
+def _xml_text(text: str) -> str:
+    return _INVALID_XML_CHARS_RE.sub("", text)
+
+
+class _XMLWriter:
+    """Buffers the serialized elements of a chunk, optionally indented."""
+
+    def __init__(self, pretty: bool):
+        self._pretty = pretty
+        self._depth = 0
+        self._parts: List[str] = []
+
+    def raw(self, text: str) -> None:
+        self._parts.append(text)
+
+    def open(self, name: str, attrs: str = "") -> None:
+        self._indent()
+        self._parts.append(f"<{name} {attrs}>" if attrs else f"<{name}>")
+        self._depth += 1
+
+    def close(self, name: str) -> None:
+        self._depth -= 1
+        self._indent()
+        self._parts.append(f"</{name}>")
+
+    def empty(self, name: str, attrs: str) -> None:
+        self._indent()
+        self._parts.append(f"<{name} {attrs}/>")
+
+    def element(self, name: str, text: str, attrs: str = "") -> None:
+        self._indent()
+        start = f"<{name} {attrs}>" if attrs else f"<{name}>"
+        self._parts.append(f"{start}{escape(_xml_text(text))}</{name}>")
+
+    def cdata(self, name: str, text: str) -> None:
+        self._indent()
+        text = _xml_text(text).replace("]]>", "]]]]><![CDATA[>")
+        self._parts.append(f"<{name}><![CDATA[{text}]]></{name}>")
+
+    def flush(self, final: bool = False) -> bytes:
+        if final and self._pretty:
+            self._parts.append("\n")
+
+        chunk = "".join(self._parts).encode("utf-8")
+        self._parts.clear()
+
+        return chunk
+
+    def _indent(self) -> None:
+        if self._pretty:
+            self._parts.append("\n" + "  " * self._depth)
@@ -0,0 +1,125 @@
+# Copyright (C) 2024 Raphael Javaux
+# raphael@noisycamp.com
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+import fcntl
+import os
+import os.path
+import sys
+import threading
+import time
+
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from web2rss.app import app
+
+
+class SingleFlight:
+    """Deduplicates concurrent executions of a function sharing the same key.
+
+    Within a process, concurrent callers wait for the first call and share its result (or
+    exception). Across processes (e.g. gunicorn workers), calls are serialized by a file lock, so
+    that the waiting callers can reuse whatever the first one cached.
+    """
+
+    def __init__(self, namespace: str):
+        self._namespace = namespace
+
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                is_leader = True
+            else:
+                is_leader = False
+
+        if not is_leader:
+            call.done.wait()
+
+            if call.error is not None:
+                raise call.error
+
+            return call.result
+
+        try:
+            with self._file_lock(key):
+                call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+            call.done.set()
+
+        return call.result
+
+    @contextmanager
+    def _file_lock(self, key: str) -> Iterator[None]:
+        lock_dir = app.config["LOCK_DIR"]
+        os.makedirs(lock_dir, exist_ok=True)
+
+        with open(os.path.join(lock_dir, f"{self._namespace}-{key}.lock"), "w") as f:
+            lock_file(f)
+
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def lock_file(f) -> None:
+    """Takes an exclusive `flock()` on the file, waiting for it without blocking the other greenlets
+    of gevent workers."""
+
+    if not _is_gevent_patched():
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return
+
+    # A blocking `flock()` would block every greenlet of the worker. Polls instead.
+    delay = 0.01
+
+    while True:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return
+        except BlockingIOError:
+            time.sleep(delay)
+            delay = min(delay * 2, 0.25)
+
+
+def _is_gevent_patched() -> bool:
+    if "gevent.monkey" not in sys.modules:
+        return False
+
+    return sys.modules["gevent.monkey"].is_module_patched("threading")
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
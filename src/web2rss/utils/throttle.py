@@ -0,0 +1,224 @@
+# Copyright (C) 2024 Raphael Javaux
+# raphael@noisycamp.com
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+
+import threading
+import time
+
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterator, Mapping, Optional, Tuple
+
+from requests.exceptions import RequestException
+
+from web2rss.app import app
+
+
+# Statuses by which websites ask clients to slow down.
+THROTTLING_STATUSES = (429, 503)
+
+
+class Throttled(RequestException):
+    """Raised instead of sending a request that would exceed the limits of the host."""
+
+    def __init__(self, host: str, retry_after: float):
+        super().__init__(f"Requests to {host} are throttled for {retry_after:.1f}s.")
+
+        self.retry_after = retry_after
+
+
+@contextmanager
+def host_slot(host: str, interactive: bool = False) -> Iterator[None]:
+    """Waits for the host's rate and concurrency limits to allow one more request.
+
+    Interactive requests (i.e. proxied for the settings page) have their own, larger, limits so that
+    pages loading many assets are not throttled, and so that they don't use the budget of the feed
+    fetches.
+
+    Raises `Throttled` if the host asked to slow down, or if the request would have to wait more
+    than `HTTP_HOST_MAX_WAIT` seconds.
+    """
+
+    limiter = _limiter(host, interactive)
+
+    limiter.acquire()
+
+    try:
+        yield
+    finally:
+        limiter.release()
+
+
+def block_host(host: str, headers: Mapping[str, str]) -> None:
+    """Stops sending requests to the host for the duration requested by its `Retry-After` header,
+    or for `HTTP_HOST_DEFAULT_COOLDOWN` seconds."""
+
+    delay = _retry_after(headers)
+
+    if delay is None:
+        delay = app.config["HTTP_HOST_DEFAULT_COOLDOWN"]
+
+    delay = min(delay, app.config["HTTP_HOST_MAX_COOLDOWN"])
+
+    for interactive in (False, True):
+        _limiter(host, interactive).block(delay)
+
+
+class _HostLimiter:
+    """Token bucket limiting the request rate to a host, and semaphore limiting the number of
+    concurrent requests."""
+
+    def __init__(self, host: str, concurrency: int, rate: float, burst: int):
+        self._host = host
+
+        self._semaphore = threading.BoundedSemaphore(concurrency)
+
+        self._lock = threading.Lock()
+
+        self._rate = rate
+        self._burst = burst
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+
+        self._blocked_until = 0.0
+
+    def acquire(self) -> None:
+        max_wait = app.config["HTTP_HOST_MAX_WAIT"]
+        deadline = time.monotonic() + max_wait
+
+        delay = self._reserve_token(max_wait)
+
+        if delay > 0:
+            time.sleep(delay)
+
+        if not self._semaphore.acquire(timeout=max(0, deadline - time.monotonic())):
+            self._return_token()
+            raise Throttled(self._host, max_wait)
+
+    def release(self) -> None:
+        self._semaphore.release()
+
+    def block(self, delay: float) -> None:
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+
+    def _return_token(self) -> None:
+        """Gives back a reserved token whose request was not sent."""
+
+        with self._lock:
+            if self._rate > 0:
+                self._tokens = min(self._burst, self._tokens + 1)
+
+    def _reserve_token(self, max_wait: float) -> float:
+        """Takes a token from the bucket, and returns the number of seconds to wait before it is
+        actually available."""
+
+        with self._lock:
+            now = time.monotonic()
+
+            if now < self._blocked_until:
+                raise Throttled(self._host, self._blocked_until - now)
+
+            if self._rate <= 0:  # Unlimited.
+                return 0.0
+
+            elapsed = now - self._updated_at
+            self._tokens = min(self._burst, self._tokens + elapsed * self._rate)
+            self._updated_at = now
+
+            # Tokens go negative while requests are queued, so that they are served in order.
+            delay = max(0.0, (1 - self._tokens) / self._rate)
+
+            if delay > max_wait:
+                raise Throttled(self._host, delay)
+
+            self._tokens -= 1
+
+            return delay
+
+
+_limiters: Dict[Tuple[str, bool], _HostLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def _limiter(host: str, interactive: bool) -> _HostLimiter:
+    with _limiters_lock:
+        limiter = _limiters.get((host, interactive))
+
+        if limiter is None:
+            if interactive:
+                limiter = _HostLimiter(
+                    host,
+                    concurrency=app.config["PROXY_HOST_CONCURRENCY"],
+                    rate=app.config["PROXY_HOST_RATE"],
+                    burst=app.config["PROXY_HOST_BURST"],
+                )
+            else:
+                limits = _host_limits(host)
+
+                limiter = _HostLimiter(
+                    host,
+                    concurrency=limits.get("concurrency", app.config["HTTP_HOST_CONCURRENCY"]),
+                    rate=limits.get("rate", app.config["HTTP_HOST_RATE"]),
+                    burst=limits.get("burst", app.config["HTTP_HOST_BURST"]),
+                )
+
+            _limiters[(host, interactive)] = limiter
+
+        return limiter
+
+
+def _host_limits(host: str) -> Dict[str, float]:
+    """Returns the limits configured for the host in `HTTP_HOST_LIMITS`, or for its closest parent
+    domain."""
+
+    host_limits = app.config["HTTP_HOST_LIMITS"]
+
+    labels = host.split(".")
+
+    for i in range(len(labels)):
+        limits = host_limits.get(".".join(labels[i:]))
+
+        if limits is not None:
+            return limits
+
+    return {}
+
+
+def _retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Parses the `Retry-After` header, either a number of seconds or an HTTP date."""
+
+    value = headers.get("retry-after")
+
+    if not value:
+        return None
+
+    value = value.strip()
+
+    if value.isdigit():
+        return float(value)
+
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+
+    return max(0.0, (date - datetime.now(tz=timezone.utc)).total_seconds())
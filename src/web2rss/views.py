@@ -16,28 +16,70 @@
 # Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
 
+import time
+
+from datetime import timedelta
+from typing import Optional, Tuple
 from urllib.parse import urlparse
 
-from flask import Response, render_template, redirect, request, url_for
+from flask import (
+    Response, g, jsonify, render_template, redirect, request, stream_with_context, url_for
+)
 
 from web2rss.app import app, db
 from web2rss.forms import SelectorForm, URLForm
-from web2rss.models import Feed
-from web2rss.utils.feed import fetch_feed_items, feed_to_rss, create_feed_from_url
+from web2rss.models import Feed, FeedSnapshot
+from web2rss.utils.compression import compress_response
+from web2rss.utils.dates import as_utc
+from web2rss.utils.fetch import forget_page
+from web2rss.utils.feed import create_feed, feed_items, refresh_feed, serialize_feed
+from web2rss.utils.jobs import run_in_background
+from web2rss.utils.metrics import exposition, inc, observe, server_timing
 from web2rss.utils.proxy import http_proxy
 
 
+@app.before_request
+def start_request_timer():
+    g.request_started_at = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response: Response) -> Response:
+    duration = time.perf_counter() - g.request_started_at
+    endpoint = request.endpoint or "unknown"
+
+    observe("web2rss_request_duration_seconds", duration, endpoint=endpoint)
+    inc("web2rss_responses_total", endpoint=endpoint, status=str(response.status_code))
+
+    timings = server_timing()
+    total = f"total;dur={duration * 1000:.1f}"
+    response.headers["Server-Timing"] = f"{timings}, {total}" if timings else total
+
+    return response
+
+
+@app.route("/metrics")
+def metrics():
+    """Reports the metrics of all the workers, in the Prometheus text format."""
+
+    return Response(exposition(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/", methods=["GET", "POST"])
 def index():
     form = URLForm(request.form)
 
     if request.method == "POST" and form.validate():
-        feed = create_feed_from_url(form.url.data)
+        feed = Feed(url=form.url.data, page_title=form.url.data, status=Feed.STATUS_PENDING)
 
         with db.session.begin():
             db.session.add(feed)
             db.session.commit()
 
+        # The webpage is fetched in the background. The settings page polls `feed_status` until
+        # the selectors are guessed, or the webpage failed to be fetched.
+        run_in_background(create_feed, feed.id)
+
         return redirect(url_for("feed_settings", id=feed.id))
     else:
         with db.session.begin():
@@ -51,15 +93,91 @@ def index():
 
 @app.route("/feed/<int:id>.xml")
 def feed_xml(id: int):
+    """Serves the last snapshot of the feed, usually pre-built by the `refresh` command.
+
+    The snapshot is only refreshed on the request path if it's missing or too old. The last good
+    snapshot is served if that refresh fails.
+    """
+
+    feed, snapshot = _feed_snapshot(id)
+
+    if snapshot is not None:
+        resp = Response(snapshot.content, mimetype="application/rss+xml")
+        return _feed_response(resp, snapshot, snapshot.etag)
+    else:
+        return "Invalid feed. Please update feed settings", 400
+
+
+@app.route("/feed/<int:id>.atom")
+def feed_atom(id: int):
+    return _streamed_feed(id, "atom", "application/atom+xml")
+
+
+@app.route("/feed/<int:id>.json")
+def feed_json(id: int):
+    return _streamed_feed(id, "json", "application/feed+json")
+
+
+def _streamed_feed(id: int, format: str, mimetype: str):
+    """Serializes the items of the feed snapshot on request, streaming the document.
+
+    The items are only loaded if the client's copy isn't up to date.
+    """
+
+    feed, snapshot = _feed_snapshot(id)
+
+    if snapshot is None:
+        return "Invalid feed. Please update feed settings", 400
+
+    # Lazily loads the items, so that they are not loaded when answering with a 304.
+    def document():
+        yield from serialize_feed(feed, feed_items(feed), format)
+
+    resp = Response(stream_with_context(document()), mimetype=mimetype)
+
+    # Prevents `make_conditional()` from consuming the stream to compute its length.
+    resp.implicit_sequence_conversion = False
+
+    return _feed_response(resp, snapshot, f"{snapshot.etag}-{format}")
+
+
+def _feed_snapshot(id: int) -> Tuple[Feed, Optional[FeedSnapshot]]:
+    """Returns the feed and its snapshot, refreshing it if it's missing or too old."""
+
     with db.session.begin():
         feed = db.session.query(Feed).get_or_404(id)
+        snapshot = feed.snapshot
+
+    max_age = timedelta(seconds=app.config["FEED_SNAPSHOT_MAX_AGE"])
 
-    items = fetch_feed_items(feed)
+    if snapshot is None or snapshot.age() >= max_age:
+        refreshed = refresh_feed(feed)
 
-    if items is not None:
-        return Response(feed_to_rss(feed, items), mimetype="application/rss+xml")
+        if refreshed is not None:
+            inc("web2rss_snapshot_total", result="refreshed")
+            snapshot = refreshed
+        elif snapshot is not None:
+            inc("web2rss_snapshot_total", result="stale")
+        else:
+            inc("web2rss_snapshot_total", result="invalid")
     else:
-        return "Invalid feed. Please update feed settings", 400
+        inc("web2rss_snapshot_total", result="fresh")
+
+    return feed, snapshot
+
+
+def _feed_response(resp: Response, snapshot: FeedSnapshot, etag: str) -> Response:
+    """Sets the caching headers of a feed document, compresses it and answers conditional
+    requests."""
+
+    resp.set_etag(etag)
+    resp.last_modified = as_utc(snapshot.last_modified)
+    resp.cache_control.public = True
+    resp.cache_control.max_age = app.config["FEED_MAX_AGE"]
+    resp.headers["Age"] = str(int(snapshot.age().total_seconds()))
+
+    # Conditional requests are evaluated on the ETag of the compressed document.
+    return compress_response(request, resp).make_conditional(request)
 
 
 @app.route("/feed/<int:id>/settings", methods=["GET", "POST"])
@@ -70,6 +188,8 @@ def feed_settings(id: int):
         with db.session.begin():
             feed = db.session.query(Feed).get_or_404(id)
 
+            previous_settings = feed.extraction_settings()
+
             feed.article_selector = form.article.data
             feed.link_selector = form.link.data
             feed.title_selector = form.title.data
@@ -77,21 +197,65 @@ def feed_settings(id: int):
             feed.author_selector = form.author.data
             feed.summary_selector = form.summary.data
 
+            feed.date_languages = form.date_languages.data
+            feed.date_order = form.date_order.data
+
+            feed.next_page_selector = form.next_page.data
+            feed.max_pages = form.max_pages.data
+
+            feed.refresh_interval = form.refresh_interval.data
+
+            # Invalidates the cached RSS document, and the items extracted with the previous
+            # settings.
+            feed.snapshot = None
+
+            if feed.extraction_settings() != previous_settings:
+                feed.items = []
+
             db.session.commit()
     else:
         with db.session.begin():
             feed = db.session.query(Feed).get_or_404(id)
+            _expire_pending_feed(feed)
 
     return render_template("feed/settings.html", feed=feed)
 
 
+@app.route("/feed/<int:id>/status")
+def feed_status(id: int):
+    with db.session.begin():
+        feed = db.session.query(Feed).get_or_404(id)
+        _expire_pending_feed(feed)
+
+    return jsonify(status=feed.status)
+
+
+def _expire_pending_feed(feed: Feed) -> None:
+    """Marks the feed as failed if it's still pending after `FEED_PENDING_TIMEOUT` seconds, as its
+    background job has been lost (e.g. its worker has been killed)."""
+
+    timeout = timedelta(seconds=app.config["FEED_PENDING_TIMEOUT"])
+
+    if feed.status == Feed.STATUS_PENDING and feed.age() >= timeout:
+        feed.status = Feed.STATUS_FAILED
+
+
 @app.route("/feed/<int:id>/delete")
 def feed_delete(id: int):
     with db.session.begin():
         feed = db.session.query(Feed).get_or_404(id)
         db.session.delete(feed)
+
+        is_url_shared = db.session.query(Feed).                     \
+            filter(Feed.url == feed.url, Feed.id != feed.id).       \
+            count() > 0
+
         db.session.commit()
 
+    # The other pages crawled for the feed are pruned with the rest of the fetch cache.
+    if not is_url_shared:
+        forget_page(feed.url)
+
     return redirect(url_for("index"))
 
 
@@ -109,11 +273,11 @@ def feed_proxy(id: int, path: str = ""):
     parsed_url = urlparse(feed.url)
 
     if path:
-        url = f"{parsed_url.scheme}://{parsed_url.hostname}/{path}"
+        url = f"{parsed_url.scheme}://{parsed_url.netloc}/{path}"
     else:
-        url = f"{parsed_url.scheme}://{parsed_url.hostname}"
+        url = f"{parsed_url.scheme}://{parsed_url.netloc}"
 
     proxied_url = lambda proxied_path: url_for("feed_proxy", id=id, path=proxied_path)
 
-    return http_proxy(proxied_url, url, request.args)
+    return http_proxy(proxied_url, url, request.args, request.headers)
 
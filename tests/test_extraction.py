@@ -0,0 +1,113 @@
+# Copyright (C) 2024 Raphael Javaux
+# raphael@noisycamp.com
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import json
+import os
+
+import pytest
+
+from web2rss.app import app
+from web2rss.models import Feed
+from web2rss.utils import html as html_module
+from web2rss.utils.feed import _article_strainer, _extract_articles
+from web2rss.utils.html import parse_html
+
+
+_CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks", "corpus")
+
+with open(os.path.join(_CORPUS_DIR, "manifest.json")) as f:
+    _MANIFEST = json.load(f)
+
+
+@pytest.mark.parametrize("page", sorted(_MANIFEST))
+def test_partial_lxml_parse_matches_html_parser(page, monkeypatch):
+    """Parsing with lxml and the selector strainer extracts the same articles as parsing the whole
+    page with `html.parser`."""
+
+    feed = _corpus_feed(page)
+
+    with open(os.path.join(_CORPUS_DIR, page), encoding="utf-8") as f:
+        html = f.read()
+
+    monkeypatch.setitem(app.config, "HTML_PARSER", "html.parser")
+    reference = _extract(feed, html, parse_only=None)
+
+    monkeypatch.setitem(app.config, "HTML_PARSER", "lxml")
+    monkeypatch.setitem(app.config, "HTML_PARTIAL_PARSE", True)
+    strainer = _article_strainer(feed)
+    articles = _extract(feed, html, parse_only=strainer)
+
+    assert strainer is not None
+    assert reference
+    assert articles == reference
+
+
+@pytest.mark.parametrize("article, title", [
+    ("article.post", "main h2"),
+    ("article.post", "body article h2"),
+    ("article", ":root h2"),
+    ("main#content > article.post", "main#content h2"),
+])
+def test_partial_parse_with_field_selectors_above_articles(article, title, monkeypatch):
+    """Field selectors that can match ancestors of the articles disable the partial parse, which
+    would otherwise not find them."""
+
+    feed = _corpus_feed("blog.html")
+    feed.article_selector = article
+    feed.title_selector = title
+
+    with open(os.path.join(_CORPUS_DIR, "blog.html"), encoding="utf-8") as f:
+        html = f.read()
+
+    monkeypatch.setitem(app.config, "HTML_PARSER", "html.parser")
+    reference = _extract(feed, html, parse_only=None)
+
+    monkeypatch.setitem(app.config, "HTML_PARSER", "lxml")
+    monkeypatch.setitem(app.config, "HTML_PARTIAL_PARSE", True)
+    strainer = _article_strainer(feed)
+    articles = _extract(feed, html, parse_only=strainer)
+
+    assert strainer is None
+    assert all(article.title for article in reference)
+    assert articles == reference
+
+
+def _corpus_feed(page: str) -> Feed:
+    settings = _MANIFEST[page]
+
+    return Feed(
+        url="https://example.com/",
+        page_title=page,
+        article_selector=settings["article"],
+        link_selector=settings.get("link"),
+        title_selector=settings.get("title"),
+        date_selector=settings.get("date"),
+        author_selector=settings.get("author"),
+        summary_selector=settings.get("summary"),
+        date_languages=settings.get("date_languages"),
+        date_order=settings.get("date_order"),
+    )
+
+
+def _extract(feed: Feed, html: str, parse_only):
+    # The tree builder is resolved once from the configuration.
+    html_module._tree_builder.cache_clear()
+
+    try:
+        return _extract_articles(feed, parse_html(html, parse_only=parse_only))
+    finally:
+        html_module._tree_builder.cache_clear()
@@ -0,0 +1,95 @@
+# Copyright (C) 2024 Raphael Javaux
+# raphael@noisycamp.com
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import dataclasses
+
+from datetime import timedelta
+
+import pytest
+
+from web2rss.app import app, db
+from web2rss.models import Feed
+from web2rss.utils import feed as feed_module
+from web2rss.utils.feed import __article_guid as _article_guid, _extract_articles, create_feed
+from web2rss.utils.html import parse_html
+
+
+_PAGE = """
+<html><body>
+    <article>
+        <a href="/post">A post</a>
+        <span class="date">{date}</span>
+    </article>
+</body></html>
+"""
+
+
+@pytest.mark.parametrize("date", ["2 hours ago", "yesterday", "5 minutes ago"])
+def test_relative_date_does_not_change_guid(date):
+    """Articles with a relative date keep the same GUID as time passes."""
+
+    article, = _extract_articles(_feed(), parse_html(_PAGE.format(date=date)))
+
+    assert article.date is not None
+    assert article.relative_date
+
+    later = dataclasses.replace(article, date=article.date - timedelta(hours=1))
+
+    assert _article_guid(later) == _article_guid(article)
+
+
+def test_absolute_date_is_part_of_guid():
+    article, = _extract_articles(_feed(), parse_html(_PAGE.format(date="March 5, 2024")))
+
+    assert article.date is not None
+    assert not article.relative_date
+
+    updated = dataclasses.replace(article, date=article.date - timedelta(days=1))
+
+    assert _article_guid(updated) != _article_guid(article)
+
+
+def test_create_feed_fails_on_unexpected_errors(monkeypatch):
+    """A pending feed is marked as failed, rather than left pending, if its analysis crashes."""
+
+    def fetch_dom(url):
+        raise RuntimeError("Unexpected")
+
+    monkeypatch.setattr(feed_module, "_fetch_dom", fetch_dom)
+
+    with app.app_context():
+        db.create_all()
+
+        with db.session.begin():
+            feed = Feed(url="https://example.com/", page_title="", status=Feed.STATUS_PENDING)
+            db.session.add(feed)
+
+        create_feed(feed.id)
+
+        with db.session.begin():
+            assert db.session.get(Feed, feed.id, populate_existing=True).status == "failed"
+
+
+def _feed() -> Feed:
+    return Feed(
+        url="https://example.com/",
+        page_title="Blog",
+        article_selector="article",
+        link_selector="a",
+        title_selector="a",
+        date_selector=".date",
+    )
@@ -0,0 +1,173 @@
+# Copyright (C) 2024 Raphael Javaux
+# raphael@noisycamp.com
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import io
+
+import pytest
+import requests
+
+from requests.structures import CaseInsensitiveDict
+from urllib3.response import HTTPResponse
+
+from web2rss.app import app
+from web2rss.utils import proxy as proxy_module
+from web2rss.utils import proxy_cache
+from web2rss.utils.proxy import _proxied_html, http_proxy
+
+
+_ORIGIN_SECURITY_HEADERS = {
+    "Set-Cookie": "session=secret; Path=/",
+    "Strict-Transport-Security": "max-age=31536000",
+    "Content-Security-Policy": "default-src 'self'",
+    "Content-Security-Policy-Report-Only": "default-src 'self'",
+    "X-Frame-Options": "DENY",
+    "Alt-Svc": 'h3=":443"',
+    "Clear-Site-Data": '"*"',
+}
+
+
+@pytest.fixture(autouse=True)
+def proxy_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, "PROXY_CACHE_DIR", str(tmp_path))
+
+
+@pytest.mark.parametrize("content_type", ["text/html; charset=utf-8", "image/png"])
+def test_proxy_drops_origin_security_headers(content_type, monkeypatch):
+    """Headers that would apply to the web2rss origin are not forwarded to the client."""
+
+    headers = {
+        "Content-Type": content_type,
+        "ETag": '"v1"',
+        "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT",
+        **_ORIGIN_SECURITY_HEADERS,
+    }
+    monkeypatch.setattr(proxy_module, "http_get", _fake_http_get(200, headers, b"<p>Hello</p>"))
+
+    response = _proxy("https://example.com/page")
+
+    assert response.status_code == 200
+    assert response.headers["etag"] == '"v1"'
+    assert response.headers["last-modified"] == "Mon, 01 Jan 2024 00:00:00 GMT"
+    for name in _ORIGIN_SECURITY_HEADERS:
+        assert name not in response.headers
+
+
+def test_proxy_rewrites_redirect_location(monkeypatch):
+    headers = {"Location": "/next", **_ORIGIN_SECURITY_HEADERS}
+    monkeypatch.setattr(proxy_module, "http_get", _fake_http_get(302, headers, b""))
+
+    response = _proxy("https://example.com/page")
+
+    assert response.status_code == 302
+    assert response.headers["location"] == "/proxy/next"
+    for name in _ORIGIN_SECURITY_HEADERS:
+        assert name not in response.headers
+
+
+def test_proxy_does_not_cache_responses_setting_cookies(monkeypatch):
+    headers = {"Content-Type": "image/png", "Cache-Control": "max-age=600", "Set-Cookie": "a=b"}
+    monkeypatch.setattr(proxy_module, "http_get", _fake_http_get(200, headers, b"image"))
+
+    _proxy("https://example.com/image.png")
+
+    assert proxy_cache.get(_cache_key("https://example.com/image.png")) is None
+
+
+def test_proxy_caches_only_allowed_headers(monkeypatch):
+    headers = {
+        "Content-Type": "image/png",
+        "Cache-Control": "max-age=600",
+        "ETag": '"v1"',
+        "X-Frame-Options": "DENY",
+    }
+    monkeypatch.setattr(proxy_module, "http_get", _fake_http_get(200, headers, b"image"))
+
+    _proxy("https://example.com/image.png")
+
+    cached = proxy_cache.get(_cache_key("https://example.com/image.png"))
+    cached.body.close()
+
+    assert cached.headers == {"content-type": "image/png", "etag": '"v1"'}
+
+
+@pytest.mark.parametrize("html, expected", [
+    # Root-relative, protocol-relative and absolute same-host URLs.
+    ('<a href="/post">', '<a href="/proxy/post">'),
+    ('<img src="//example.com/a.png">', '<img src="/proxy/a.png">'),
+    ("<a href='https://EXAMPLE.com/post'>", "<a href='/proxy/post'>"),
+    ("<a href=/post>", "<a href=/proxy/post>"),
+    # Other hosts and relative URLs are left untouched.
+    ('<a href="https://other.com/post">', '<a href="https://other.com/post">'),
+    ('<img src="//other.com/a.png">', '<img src="//other.com/a.png">'),
+    ('<a href="post">', '<a href="post">'),
+    # srcset candidates.
+    (
+        '<img srcset="/a.png 1x, //example.com/b.png 2x,https://other.com/c.png 3x">',
+        '<img srcset="/proxy/a.png 1x, /proxy/b.png 2x,https://other.com/c.png 3x">',
+    ),
+    # Inline styles, with escaped quotes.
+    (
+        '<div style="background: url(&quot;/bg.png&quot;)">',
+        '<div style="background: url(&quot;/proxy/bg.png&quot;)">',
+    ),
+    ("<div style='background: url(/bg.png)'>", "<div style='background: url(/proxy/bg.png)'>"),
+    # Quoted attribute values containing `>`.
+    (
+        '<a title="a > b" href="/post">x</a><img src="/a.png">',
+        '<a title="a > b" href="/proxy/post">x</a><img src="/proxy/a.png">',
+    ),
+    # <style> bodies are rewritten, <script> bodies and comments are not.
+    (
+        '<style>body { background: url("/bg.png") }</style>',
+        '<style>body { background: url("/proxy/bg.png") }</style>',
+    ),
+    (
+        '<script src="/app.js">var a = "<a href=\'/post\'>";</script>',
+        '<script src="/proxy/app.js">var a = "<a href=\'/post\'>";</script>',
+    ),
+    ('<!-- <a href="/post"> -->', '<!-- <a href="/post"> -->'),
+])
+def test_proxied_html_rewrites_urls(html, expected):
+    assert _proxied_html(lambda path: f"/proxy/{path}", "https://example.com/", html) == expected
+
+
+def _cache_key(url: str) -> str:
+    return proxy_cache.cache_key("/proxy/", url, {})
+
+
+def _proxy(url: str):
+    with app.test_request_context():
+        response = http_proxy(lambda path: f"/proxy/{path}", url, {}, {})
+        b"".join(response.response)
+        response.close()
+
+    return response
+
+
+def _fake_http_get(status: int, headers: dict, body: bytes):
+    def http_get(url, **kwargs):
+        resp = requests.Response()
+        resp.status_code = status
+        resp.headers = CaseInsensitiveDict(headers)
+        resp.raw = HTTPResponse(
+            io.BytesIO(body), headers=headers, status=status, preload_content=False
+        )
+        resp.url = url
+        resp.encoding = "utf-8"
+        return resp
+
+    return http_get
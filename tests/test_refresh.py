@@ -0,0 +1,68 @@
+# Copyright (C) 2024 Raphael Javaux
+# raphael@noisycamp.com
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from datetime import datetime, timedelta, timezone
+
+from web2rss.app import app, db
+from web2rss.models import Feed, FeedSnapshot
+from web2rss.utils.refresh import _due_feed_ids
+
+
+def test_due_feed_ids():
+    now = datetime.now(tz=timezone.utc)
+
+    with app.app_context():
+        db.create_all()
+
+        with db.session.begin():
+            never_refreshed = _add_feed()
+            stale = _add_feed(refreshed_at=now - timedelta(hours=2))
+            fresh = _add_feed(refreshed_at=now - timedelta(minutes=5))
+            short_interval = _add_feed(refreshed_at=now - timedelta(minutes=5), interval=60)
+            invalid = _add_feed(title_selector="")
+
+        due = _due_feed_ids()
+
+    assert never_refreshed.id in due
+    assert stale.id in due
+    assert fresh.id not in due
+    assert short_interval.id in due
+    assert invalid.id not in due
+
+
+def _add_feed(refreshed_at=None, interval=None, title_selector="h2") -> Feed:
+    feed = Feed(
+        url="https://example.com/",
+        page_title="Blog",
+        article_selector="article",
+        title_selector=title_selector,
+        refresh_interval=interval,
+    )
+    db.session.add(feed)
+    db.session.flush()
+
+    if refreshed_at is not None:
+        db.session.add(FeedSnapshot(
+            feed_id=feed.id,
+            refreshed_at=refreshed_at,
+            cache_key="",
+            content=b"",
+            etag="",
+            last_modified=refreshed_at,
+        ))
+
+    return feed
@@ -0,0 +1,61 @@
+# Copyright (C) 2024 Raphael Javaux
+# raphael@noisycamp.com
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 3 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import xml.etree.ElementTree as ET
+
+from datetime import datetime, timezone
+
+import pytest
+
+from web2rss.models import Feed, FeedItem
+from web2rss.utils import serializers
+
+
+_NOW = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize("serializer", [serializers.rss, serializers.atom])
+def test_invalid_xml_characters_are_removed(serializer):
+    """Control characters scraped from the webpage, including in URLs, are not valid XML."""
+
+    document = b"".join(serializer(*_document_args()))
+
+    ET.fromstring(document)
+
+
+def test_atom_links_are_valid_xml():
+    root = ET.fromstring(b"".join(serializers.atom(*_document_args())))
+
+    hrefs = {link.get("href") for link in root.iter("{http://www.w3.org/2005/Atom}link")}
+
+    assert hrefs == {
+        "https://example.com/", "https://example.com/post", "https://web2rss.example/1",
+    }
+
+
+def _document_args():
+    feed = Feed(id=1, url="https://example.com/\x0b", page_title="Blog\x08")
+    item = FeedItem(
+        guid="guid",
+        first_seen_at=_NOW,
+        published_at=_NOW,
+        link="https://example.com/post\x0c",
+        title="A\x00 post",
+        summary="Summary\x1f",
+    )
+
+    return feed, [item], "https://web2rss.example/1\x0b", _NOW